@@ -1,17 +1,26 @@
 """
 FastAPI routes for exam answer sheet processing
 """
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-import json as _json
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import json
 import logging
+import shutil
+import tempfile
 import time
 
 from backend.db.database import get_db, SessionLocal
+from backend.db.async_database import get_async_db
 from backend.db.models import (
     ExamSubmission,
     ProcessingLog, CandidateResult, AnswerKey,
@@ -40,17 +49,18 @@ from backend.services.json_generator import get_json_generator
 from backend.services.space_client import get_spaces_client
 from backend.services.image_preprocessor import ImagePreprocessor
 from backend.services.ocr_results_writer import get_ocr_results_writer
+from backend.services.extraction_cache import ExtractionCache, get_extraction_cache, hash_file
 from backend.config import get_settings
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 # ---------------------------- Exams APIs ------------------------------
 
 
 @router.post("/exams", response_model=ExamResponse)
-async def create_exam(body: ExamCreateSchema, db: Session = Depends(get_db)):
+def create_exam(body: ExamCreateSchema, db: Session = Depends(get_db)):
     exam = Exam(name=body.name)
     db.add(exam)
     db.commit()
@@ -59,13 +69,19 @@ async def create_exam(body: ExamCreateSchema, db: Session = Depends(get_db)):
 
 
 @router.get("/exams", response_model=List[ExamResponse])
-async def list_exams(db: Session = Depends(get_db)):
+def list_exams(db: Session = Depends(get_db)):
     return db.query(Exam).order_by(Exam.created_at.desc()).all()
 
 
 @router.get("/exams/{exam_id}", response_model=ExamDetailResponse)
-async def get_exam(exam_id: int, db: Session = Depends(get_db)):
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+def get_exam(exam_id: int, db: Session = Depends(get_db)):
+    # Both collections are serialized; load them with one IN query each up front
+    exam = (
+        db.query(Exam)
+        .options(selectinload(Exam.documents), selectinload(Exam.generated_jsons))
+        .filter(Exam.id == exam_id)
+        .first()
+    )
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
     return exam
@@ -75,14 +91,20 @@ async def get_exam(exam_id: int, db: Session = Depends(get_db)):
 async def upload_correction_pdf(exam_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
     if not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="A valid PDF file is required")
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+    await _validate_pdf_upload(file)
+    # The sync Session blocks; its calls run in the threadpool, off the event loop
+    exam = await run_in_threadpool(db.get, Exam, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
     storage = get_local_storage()
-    saved = storage.save_pdf(file.file, f"exam_{exam_id}_correction.pdf")
-    exam.correction_pdf_path = saved["relative_path"]
-    db.commit()
-    db.refresh(exam)
+    saved = await storage.save_pdf_async(file, f"exam_{exam_id}_correction.pdf")
+
+    def _save_correction():
+        exam.correction_pdf_path = saved["relative_path"]
+        db.commit()
+        db.refresh(exam)
+
+    await run_in_threadpool(_save_correction)
     return exam
 
 
@@ -90,40 +112,39 @@ async def upload_correction_pdf(exam_id: int, file: UploadFile = File(...), db:
 async def upload_student_pdf(exam_id: int, country: Optional[str] = None, file: UploadFile = File(...), db: Session = Depends(get_db)):
     if not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="A valid PDF file is required")
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+    await _validate_pdf_upload(file)
+    exam = await run_in_threadpool(db.get, Exam, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
     storage = get_local_storage()
-    saved = storage.save_pdf(file.file, file.filename)
+    saved = await storage.save_pdf_async(file, file.filename)
     pdf_converter = get_pdf_converter()
     
     absolute_path = storage.get_absolute_path(saved["relative_path"])
     if not absolute_path:
         raise HTTPException(status_code=500, detail="Could not resolve saved file path")
 
-    image_paths = pdf_converter.convert_from_file(absolute_path)
-    pages = len(image_paths)
-    # cleanup images
-    for img in image_paths:
-        try:
-            Path(img).unlink(missing_ok=True)
-        except Exception:
-            pass
+    # Only the page count is stored here; rendering happens at extraction time
+    pages = await run_in_threadpool(pdf_converter.get_page_count, absolute_path)
     doc = ExamDocument(
         exam_id=exam_id,
         country=country,
         file_path=saved["relative_path"],
         pages_count=pages,
     )
-    db.add(doc)
-    db.commit()
-    db.refresh(doc)
+
+    def _save_document():
+        db.add(doc)
+        db.commit()
+        db.refresh(doc)
+
+    await run_in_threadpool(_save_document)
     return doc
 
 
 @router.post("/exams/{exam_id}/extract/{document_id}", response_model=GeneratedJSONResponse)
-async def extract_exam_document(exam_id: int, document_id: int, db: Session = Depends(get_db)):
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
+def extract_exam_document(exam_id: int, document_id: int, db: Session = Depends(get_db)):
+    exam = db.get(Exam, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
     doc = db.query(ExamDocument).filter(ExamDocument.id == document_id, ExamDocument.exam_id == exam_id).first()
@@ -139,123 +160,118 @@ async def extract_exam_document(exam_id: int, document_id: int, db: Session = De
     if absolute_pdf is None:
         raise HTTPException(status_code=500, detail="Could not resolve PDF file path")
     
-    try:
-        all_image_paths = pdf_converter.convert_from_file(absolute_pdf)
-    except Exception as e:
-        logger.error(f"Failed to convert PDF for doc_id={document_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"PDF conversion failed: {e}")
-
-    valid_image_paths = []
-    for image_path in all_image_paths:
-        # 1. Check if the page is blank
-        if image_preprocessor.is_blank(image_path):
-            logger.info(f"Skipping blank page: {Path(image_path).name}")
-            continue
-
-        # 2. Archive the valid image to Spaces (if enabled)
+    # All page images live in one work dir, removed in a single walk on exit
+    with tempfile.TemporaryDirectory(prefix=f"exam_{exam_id}_doc_{document_id}_") as work_dir:
         try:
-            space_client.upload_image(
-                image_path=image_path,
-                submission_id=document_id, # Using document_id as a proxy for submission_id
-                original_pdf_name=Path(absolute_pdf).name
-            )
+            all_image_paths = pdf_converter.convert_from_file(absolute_pdf, output_dir=work_dir)
         except Exception as e:
-            # Log the error but don't block the main extraction process
-            logger.error(f"Failed to archive image {Path(image_path).name} to Spaces: {e}")
+            logger.error(f"Failed to convert PDF for doc_id={document_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"PDF conversion failed: {e}")
 
-        valid_image_paths.append(image_path)
+        valid_image_paths = []
+        for image_path in all_image_paths:
+            # 1. Check if the page is blank
+            if image_preprocessor.is_blank(image_path):
+                logger.info(f"Skipping blank page: {Path(image_path).name}")
+                continue
 
-    if not valid_image_paths:
-        # If all pages were blank, there's nothing to process.
-        logger.warning(f"No valid (non-blank) pages found in PDF for doc_id={document_id}. Aborting extraction.")
-        # We could raise an error or return a specific response.
-        # For now, let's create an empty JSON record to signify it was "processed".
-        record = GeneratedJSON(
-            exam_id=exam_id,
-            file_path=None,
-            filename=f"exam_{exam_id}_doc_{document_id}_empty.json",
-            metadata={"status": "aborted", "reason": "No valid pages found"}
-        )
-        db.add(record)
-        db.commit()
-        db.refresh(record)
-        return record
-
-    _save_ocr_results(
-        image_paths=valid_image_paths,
-        context_id=f"exam_{exam_id}_document_{document_id}",
-        source_filename=Path(absolute_pdf).name,
-    )
-
-    ai_extractor = get_ai_extractor()
-    settings = get_settings()
+            # 2. Archive the valid image to Spaces (if enabled)
+            try:
+                space_client.upload_image(
+                    image_path=image_path,
+                    submission_id=document_id, # Using document_id as a proxy for submission_id
+                    original_pdf_name=Path(absolute_pdf).name
+                )
+            except Exception as e:
+                # Log the error but don't block the main extraction process
+                logger.error(f"Failed to archive image {Path(image_path).name} to Spaces: {e}")
+
+            valid_image_paths.append(image_path)
+
+        if not valid_image_paths:
+            # If all pages were blank, there's nothing to process.
+            logger.warning(f"No valid (non-blank) pages found in PDF for doc_id={document_id}. Aborting extraction.")
+            # We could raise an error or return a specific response.
+            # For now, let's create an empty JSON record to signify it was "processed".
+            record = GeneratedJSON(
+                exam_id=exam_id,
+                file_path=None,
+                filename=f"exam_{exam_id}_doc_{document_id}_empty.json",
+                metadata={"status": "aborted", "reason": "No valid pages found"}
+            )
+            db.add(record)
+            db.commit()
+            db.refresh(record)
+            return record
 
-    extraction_result = ai_extractor.extract_from_multiple_images(
-        valid_image_paths,  # Use only valid images
-        use_parallel=settings.use_parallel_extraction,
-        max_workers=settings.max_extraction_workers,
-    )
+        _save_ocr_results(
+            image_paths=valid_image_paths,
+            context_id=f"exam_{exam_id}_document_{document_id}",
+            source_filename=Path(absolute_pdf).name,
+        )
 
-    validation_result = ai_extractor.validate_extraction(extraction_result)
+        ai_extractor = get_ai_extractor()
+        settings = get_settings()
 
-    json_generator = get_json_generator()
-    if settings.minimal_output:
-        json_data = json_generator.generate_minimal(
-            Path(absolute_pdf).name,
-            extraction_result,
-        )
-    else:
-        json_data = json_generator.generate_with_validation(
-            Path(absolute_pdf).name,
-            extraction_result,
-            validation_result,
+        extraction_result = ai_extractor.extract_from_multiple_images(
+            valid_image_paths,  # Use only valid images
+            use_parallel=settings.use_parallel_extraction,
+            max_workers=_extraction_workers(len(valid_image_paths)),
         )
 
-    json_filename = f"exam_{exam_id}_doc_{document_id}.json"
-    saved_json = storage.save_json(json_data, json_filename)
+        validation_result = ai_extractor.validate_extraction(extraction_result)
+
+        json_generator = get_json_generator()
+        if settings.minimal_output:
+            json_data = json_generator.generate_minimal(
+                Path(absolute_pdf).name,
+                extraction_result,
+            )
+        else:
+            json_data = json_generator.generate_with_validation(
+                Path(absolute_pdf).name,
+                extraction_result,
+                validation_result,
+            )
 
-    record = GeneratedJSON(
-        exam_id=exam_id,
-        file_path=saved_json["relative_path"],
-        filename=json_filename,
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+        json_filename = f"exam_{exam_id}_doc_{document_id}.json"
+        saved_json = storage.save_json(json_data, json_filename)
 
-    # cleanup all generated images (blank and valid)
-    for img in all_image_paths:
-        try:
-            Path(img).unlink(missing_ok=True)
-        except Exception:
-            pass
+        record = GeneratedJSON(
+            exam_id=exam_id,
+            file_path=saved_json["relative_path"],
+            filename=json_filename,
+        )
+        db.add(record)
+        db.commit()
+        db.refresh(record)
 
-    return record
+        return record
 
 
 @router.get("/exams/{exam_id}/jsons", response_model=List[GeneratedJSONResponse])
-async def list_exam_jsons(exam_id: int, db: Session = Depends(get_db)):
+def list_exam_jsons(exam_id: int, db: Session = Depends(get_db)):
     return db.query(GeneratedJSON).filter(GeneratedJSON.exam_id == exam_id).order_by(GeneratedJSON.created_at.desc()).all()
 
 
 @router.get("/jsons/{json_id}")
-async def download_json(json_id: int, db: Session = Depends(get_db)):
+def download_json(json_id: int, db: Session = Depends(get_db)):
     storage = get_local_storage()
-    record = db.query(GeneratedJSON).filter(GeneratedJSON.id == json_id).first()
+    record = db.get(GeneratedJSON, json_id)
     if not record:
         raise HTTPException(status_code=404, detail="JSON not found")
     if not record.file_path:
         raise HTTPException(status_code=404, detail="No file associated with this record")
-    abs_path = storage.get_absolute_path(record.file_path)
-    if not abs_path or not Path(abs_path).exists():
+    json_bytes = storage.read_json_bytes(record.file_path)
+    if json_bytes is None:
         raise HTTPException(status_code=404, detail="File missing")
-    return JSONResponse(content=_json.loads(Path(abs_path).read_text(encoding="utf-8")))
+    return Response(content=json_bytes, media_type="application/json")
 
 
 @router.delete("/jsons/{json_id}")
-async def delete_json(json_id: int, db: Session = Depends(get_db)):
+def delete_json(json_id: int, db: Session = Depends(get_db)):
     storage = get_local_storage()
-    record = db.query(GeneratedJSON).filter(GeneratedJSON.id == json_id).first()
+    record = db.get(GeneratedJSON, json_id)
     if not record:
         raise HTTPException(status_code=404, detail="JSON not found")
     if record.file_path:
@@ -277,6 +293,28 @@ def _safe_int(value, default: int = 0) -> int:
         return default
 
 
+PDF_MAGIC = b"%PDF-"
+
+
+async def _validate_pdf_upload(file: UploadFile) -> None:
+    """Reject oversized or non-PDF uploads before they are stored or rasterized."""
+    max_bytes = get_settings().max_file_size_mb * 1024 * 1024
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds the {get_settings().max_file_size_mb} MB upload limit",
+        )
+    head = await file.read(len(PDF_MAGIC))
+    await file.seek(0)
+    if head != PDF_MAGIC:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a PDF")
+
+
+def _extraction_workers(page_count: int) -> int:
+    """Cap extraction threads at the page count so small PDFs don't spawn idle workers."""
+    return max(1, min(page_count, get_settings().max_extraction_workers))
+
+
 def _write_processing_log(
     db: Session,
     submission_id: int,
@@ -284,20 +322,32 @@ def _write_processing_log(
     status: str,
     message: str,
     extra_data: Optional[dict] = None,
+    commit: bool = True,
 ) -> None:
-    """Write a processing log entry without breaking the caller flow."""
+    """Write a processing log entry without breaking the caller flow.
+
+    With commit=False the entry is only flushed and is persisted by the
+    caller's next commit. The insert runs in a SAVEPOINT, so a failed log row
+    is rolled back without discarding the caller's pending changes.
+    """
     try:
-        db.add(ProcessingLog(
-            submission_id=submission_id,
-            action=action,
-            status=status,
-            message=message,
-            extra_data=extra_data,
-        ))
-        db.commit()
+        with db.begin_nested():
+            db.add(ProcessingLog(
+                submission_id=submission_id,
+                action=action,
+                status=status,
+                message=message,
+                extra_data=extra_data,
+            ))
     except Exception as log_error:
-        db.rollback()
         logger.warning("Failed to write log action=%s for submission=%s: %s", action, submission_id, log_error)
+        return
+    if commit:
+        try:
+            db.commit()
+        except Exception as log_error:
+            db.rollback()
+            logger.warning("Failed to commit log action=%s for submission=%s: %s", action, submission_id, log_error)
 
 
 def _save_ocr_results(
@@ -348,20 +398,39 @@ def _save_ocr_results(
         return None
 
 
-def process_pdf_extraction(submission_id: int, pdf_path: str):
+def _extraction_cache_config(ai_extractor) -> dict:
+    """Everything besides the PDF bytes that determines the extraction output."""
+    settings = get_settings()
+    return {
+        "provider": "gemini",
+        "model": str(getattr(ai_extractor, "model_name", settings.gemini_model)),
+        "prompt_version": str(getattr(ai_extractor, "prompt_version", "")),
+        "pipeline": (
+            f"{type(ai_extractor).__name__}"
+            f"|preprocess={settings.enable_image_preprocessing}:{settings.preprocessing_mode}"
+            f"|render={settings.pdf_render_dpi}:{settings.pdf_render_format}"
+            f"|batch={getattr(ai_extractor, 'batch_size', 1)}"
+            f"|image={getattr(ai_extractor, 'image_max_edge', '')}"
+        ),
+    }
+
+
+def process_pdf_extraction(submission_id: int, pdf_path: str, pdf_sha256: Optional[str] = None):
     """Background task to convert pages, extract answers, and persist JSON locally."""
     db = SessionLocal()
     image_paths: List[str] = []
+    work_dir: Optional[str] = None
     job_started = time.perf_counter()
+    sub: Optional[ExamSubmission] = None
     try:
-        sub = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
+        # The submission is loaded once and reused; each phase below ends in a
+        # single commit so polling clients see its status/progress together.
+        sub = db.get(ExamSubmission, submission_id)
         if not sub:
             logger.error(f"Submission {submission_id} not found")
             return
 
         setattr(sub, 'status', 'processing')
-        db.commit()
-
         _write_processing_log(
             db,
             submission_id,
@@ -369,87 +438,121 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
             status="success",
             message="Starting PDF extraction",
             extra_data={"pdf_path": pdf_path},
+            commit=False,
         )
+        db.commit()
 
-        _write_processing_log(
-            db,
-            submission_id,
-            action="extract_stage",
-            status="info",
-            message="Converting PDF pages to images",
-            extra_data={"stage": "pdf_to_images"},
-        )
+        ai_extractor = get_ai_extractor()
+        settings = get_settings()
 
-        logger.info(f"Converting PDF to images: {pdf_path}")
-        conversion_started = time.perf_counter()
-        pdf_converter = get_pdf_converter()
-        image_paths = pdf_converter.convert_from_file(pdf_path)
-        conversion_seconds = time.perf_counter() - conversion_started
+        # Identical PDFs processed with the same model/prompt skip the pipeline entirely
+        cache = get_extraction_cache()
+        cache_key = None
+        cache_config = _extraction_cache_config(ai_extractor)
+        cached = None
+        if cache is not None:
+            cache_key = ExtractionCache.make_key(pdf_sha256 or hash_file(pdf_path), **cache_config)
+            cached = cache.get(cache_key)
+
+        conversion_seconds = 0.0
+        extraction_seconds = 0.0
+        if cached:
+            extraction_result = cached["extraction_result"]
+            validation_result = cached["validation_result"]
+            setattr(sub, 'pages_count', _safe_int(extraction_result.get('pages_processed'), 0))
+            _write_processing_log(
+                db,
+                submission_id,
+                action="extract_stage",
+                status="info",
+                message="Reused cached extraction for identical PDF",
+                extra_data={"stage": "cache_hit", "cache_key": cache_key},
+                commit=False,
+            )
+            db.commit()
+        else:
+            _write_processing_log(
+                db,
+                submission_id,
+                action="extract_stage",
+                status="info",
+                message="Converting PDF pages to images",
+                extra_data={"stage": "pdf_to_images"},
+            )
 
-        setattr(sub, 'pages_count', len(image_paths))
-        db.commit()
+            logger.info(f"Converting PDF to images: {pdf_path}")
+            conversion_started = time.perf_counter()
+            pdf_converter = get_pdf_converter()
+            work_dir = tempfile.mkdtemp(prefix=f"submission_{submission_id}_")
+            # Render in-process: this already runs in a PDF pool worker (or Celery child)
+            image_paths = pdf_converter.convert_from_file(pdf_path, output_dir=work_dir)
+            conversion_seconds = time.perf_counter() - conversion_started
 
-        _write_processing_log(
-            db,
-            submission_id,
-            action="extract_stage",
-            status="info",
-            message=f"Converted PDF to {len(image_paths)} page images",
-            extra_data={
-                "stage": "pdf_to_images",
-                "pages": len(image_paths),
-                "duration_seconds": round(conversion_seconds, 2),
-            },
-        )
+            setattr(sub, 'pages_count', len(image_paths))
+            _write_processing_log(
+                db,
+                submission_id,
+                action="extract_stage",
+                status="info",
+                message=f"Converted PDF to {len(image_paths)} page images",
+                extra_data={
+                    "stage": "pdf_to_images",
+                    "pages": len(image_paths),
+                    "duration_seconds": round(conversion_seconds, 2),
+                },
+                commit=False,
+            )
+            db.commit()
 
-        source_filename = str(getattr(sub, "filename") or Path(pdf_path).name)
-        _save_ocr_results(
-            image_paths=image_paths,
-            context_id=f"submission_{submission_id}",
-            source_filename=source_filename,
-            db=db,
-            submission_id=submission_id,
-        )
+            source_filename = str(getattr(sub, "filename") or Path(pdf_path).name)
+            _save_ocr_results(
+                image_paths=image_paths,
+                context_id=f"submission_{submission_id}",
+                source_filename=source_filename,
+                db=db,
+                submission_id=submission_id,
+            )
 
-        logger.info(f"Extracting answers using AI from {len(image_paths)} pages")
-        ai_extractor = get_ai_extractor()
-        settings = get_settings()
+            logger.info(f"Extracting answers using AI from {len(image_paths)} pages")
 
-        _write_processing_log(
-            db,
-            submission_id,
-            action="extract_stage",
-            status="info",
-            message="AI extraction started",
-            extra_data={
-                "stage": "ai_extraction",
-                "parallel": bool(settings.use_parallel_extraction),
-                "workers": int(settings.max_extraction_workers),
-                "pages": len(image_paths),
-            },
-        )
+            _write_processing_log(
+                db,
+                submission_id,
+                action="extract_stage",
+                status="info",
+                message="AI extraction started",
+                extra_data={
+                    "stage": "ai_extraction",
+                    "parallel": bool(settings.use_parallel_extraction),
+                    "workers": _extraction_workers(len(image_paths)),
+                    "pages": len(image_paths),
+                },
+            )
 
-        extraction_started = time.perf_counter()
-        extraction_result = ai_extractor.extract_from_multiple_images(
-            image_paths,
-            extraction_prompt=None,
-            submission_id=submission_id,
-            db=db,
-            use_parallel=settings.use_parallel_extraction,
-            max_workers=settings.max_extraction_workers
-        )
-        extraction_seconds = time.perf_counter() - extraction_started
+            extraction_started = time.perf_counter()
+            extraction_result = ai_extractor.extract_from_multiple_images(
+                image_paths,
+                extraction_prompt=None,
+                submission_id=submission_id,
+                db=db,
+                use_parallel=settings.use_parallel_extraction,
+                max_workers=_extraction_workers(len(image_paths))
+            )
+            extraction_seconds = time.perf_counter() - extraction_started
+
+            validation_result = ai_extractor.validate_extraction(extraction_result)
+            if cache is not None and cache_key and extraction_result.get('pages_with_data'):
+                cache.put(cache_key, extraction_result, validation_result, config=cache_config)
 
-        validation_result = ai_extractor.validate_extraction(extraction_result)
         json_gen = get_json_generator()
-        json_data = json_gen.generate_with_validation(
+        json_output = json_gen.build_with_validation(
             str(getattr(sub, 'filename')),
             extraction_result,
             validation_result
         )
         storage = get_local_storage()
         json_filename = f"{Path(str(getattr(sub, 'filename'))).stem}.json"
-        save = storage.save_json(json_data, json_filename)
+        save = storage.save_json_obj(json_output, json_filename)
         setattr(sub, 'result_json_key', save['relative_path'])
 
         _write_processing_log(
@@ -459,6 +562,7 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
             status="info",
             message=f"Saved JSON results to {save['relative_path']}",
             extra_data={"stage": "save_json", "relative_path": save["relative_path"]},
+            commit=False,
         )
 
         # Save per-candidate results to DB (supports dynamic header fields)
@@ -473,6 +577,7 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
             "student_name": "candidate_name",
             "student_number": "candidate_number",
         }
+        candidate_rows = []
         for candidate in extraction_result.get('candidates', []):
             # Apply field aliases before splitting known vs extra
             normalized = {}
@@ -491,17 +596,20 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
                 if k not in KNOWN_COLUMNS and k not in EXCLUDED_KEYS:
                     # Convert to string for schema compatibility
                     extra[k] = str(v) if v is not None else ''
-            db.add(CandidateResult(
-                submission_id=submission_id,
-                page_number=normalized.get('page_number'),
-                candidate_name=normalized.get('candidate_name', ''),
-                candidate_number=normalized.get('candidate_number', ''),
-                country=normalized.get('country', ''),
-                paper_type=normalized.get('paper_type', ''),
-                extra_fields=extra if extra else None,
-                answers=normalized.get('answers', {}),
-                drawing_questions=normalized.get('drawing_questions', {}),
-            ))
+            candidate_rows.append({
+                "submission_id": submission_id,
+                "page_number": normalized.get('page_number'),
+                "candidate_name": normalized.get('candidate_name', ''),
+                "candidate_number": normalized.get('candidate_number', ''),
+                "country": normalized.get('country', ''),
+                "paper_type": normalized.get('paper_type', ''),
+                "extra_fields": extra if extra else None,
+                "answers": normalized.get('answers', {}),
+                "drawing_questions": normalized.get('drawing_questions', {}),
+            })
+        # Core executemany INSERT: no per-row unit-of-work state
+        if candidate_rows:
+            db.execute(insert(CandidateResult), candidate_rows)
 
         candidates = extraction_result.get('candidates', [])
         answers_count = sum(len((candidate.get('answers') or {})) for candidate in candidates)
@@ -517,8 +625,6 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
 
         setattr(sub, 'status', 'completed')
         setattr(sub, 'processed_at', datetime.utcnow())
-        db.commit()
-
         _write_processing_log(
             db,
             submission_id,
@@ -535,18 +641,19 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
                 "extraction_seconds": round(extraction_seconds, 2),
                 "total_seconds": round(total_duration, 2),
             },
+            commit=False,
         )
+        # Results, candidate rows, completion status and summary land together
+        db.commit()
 
         logger.info(f"Successfully processed submission {submission_id}")
 
     except Exception as e:
         logger.exception(f"Failed to process submission {submission_id}: {e}")
         db.rollback()
-        sub = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
-        if sub:
+        if sub is not None:
             setattr(sub, 'status', 'failed')
             setattr(sub, 'error_message', str(e))
-            db.commit()
             _write_processing_log(
                 db,
                 submission_id,
@@ -554,16 +661,50 @@ def process_pdf_extraction(submission_id: int, pdf_path: str):
                 status="error",
                 message=str(e),
                 extra_data={"total_seconds": round(time.perf_counter() - job_started, 2)},
+                commit=False,
             )
+            db.commit()
     finally:
-        for image_path in image_paths:
-            try:
-                Path(image_path).unlink(missing_ok=True)
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to cleanup image {image_path}: {cleanup_error}")
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
         db.close()
 
 
+# Extraction jobs run in a dedicated process pool so rasterization and model
+# calls never occupy the API's event loop or threadpool. max_concurrent_pdfs
+# workers bound how many jobs are in flight (each one renders every page to
+# disk); further jobs queue in the executor. Workers are spawned, not forked:
+# forking the multithreaded server can copy locks held by other threads
+# (logging, the DB pool, gRPC) into the child and deadlock it.
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        _PDF_POOL = ProcessPoolExecutor(
+            max_workers=max(1, get_settings().max_concurrent_pdfs),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _PDF_POOL
+
+
+async def run_pdf_extraction(submission_id: int, pdf_path: str, pdf_sha256: Optional[str] = None):
+    """Run process_pdf_extraction in the worker pool."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        _get_pdf_pool(), process_pdf_extraction, submission_id, pdf_path, pdf_sha256
+    )
+
+
+def shutdown_pdf_pool():
+    """Stop the extraction worker pool (called on application shutdown)."""
+    global _PDF_POOL
+    if _PDF_POOL is not None:
+        _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+        _PDF_POOL = None
+
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_pdf(
     background_tasks: BackgroundTasks,
@@ -582,43 +723,63 @@ async def upload_pdf(
     """
     if not file or not file.filename or not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    await _validate_pdf_upload(file)
 
     try:
         storage = get_local_storage()
         logger.info(f"Storing PDF locally: {file.filename}")
-        upload_result = storage.save_pdf(file.file, file.filename)
+        upload_result = await storage.save_pdf_async(file, file.filename)
         
-        # Create database entry
-        submission = ExamSubmission(
-            filename=file.filename,
-            original_pdf_key=upload_result['relative_path'],
-            status="pending"
-        )
-        db.add(submission)
-        db.commit()
-        db.refresh(submission)
-        
-        # Log upload
-        log_entry = ProcessingLog(
-            submission_id=submission.id,
-            action="upload",
-            status="success",
-            message=f"Stored {file.filename} at {upload_result['relative_path']}"
-        )
-        db.add(log_entry)
-        db.commit()
+        def _create_submission() -> int:
+            submission = ExamSubmission(
+                filename=file.filename,
+                original_pdf_key=upload_result['relative_path'],
+                status="pending"
+            )
+            db.add(submission)
+            # Flush populates the primary key (RETURNING / lastrowid); capture it
+            # before commit expires the instance so no refresh SELECT is needed
+            db.flush()
+            submission_id = submission.id
+            db.add(ProcessingLog(
+                submission_id=submission_id,
+                action="upload",
+                status="success",
+                message=f"Stored {file.filename} at {upload_result['relative_path']}"
+            ))
+            db.commit()
+            return submission_id
+
+        # Create the database entry and upload log off the event loop (sync Session)
+        submission_id = await run_in_threadpool(_create_submission)
         
         # Schedule background processing
-        background_tasks.add_task(process_pdf_extraction, submission.id, upload_result['absolute_path'])
+        task_id = None
+        if get_settings().use_celery_worker:
+            from backend.worker import extract_submission
+            task = extract_submission.delay(
+                submission_id,
+                upload_result['absolute_path'],
+                upload_result.get('sha256'),
+            )
+            task_id = task.id
+        else:
+            background_tasks.add_task(
+                run_pdf_extraction,
+                submission_id,
+                upload_result['absolute_path'],
+                upload_result.get('sha256'),
+            )
         
-        logger.info(f"Created submission {submission.id} for {file.filename}")
+        logger.info(f"Created submission {submission_id} for {file.filename}")
         
         return UploadResponse(
             status="success",
             message="PDF uploaded successfully. Processing started.",
-            submission_id=submission.id,
+            submission_id=submission_id,
             filename=file.filename,
-            storage_path=upload_result['relative_path']
+            storage_path=upload_result['relative_path'],
+            task_id=task_id,
         )
         
     except Exception as e:
@@ -626,8 +787,44 @@ async def upload_pdf(
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+async def _answer_counts(db: AsyncSession, submission_ids: Iterable[int]) -> Dict[int, Tuple[int, int, int]]:
+    """Return {submission_id: (candidates_count, answers_count, drawing_count)} in one query.
+
+    Answers live in JSON columns, so only those two columns are fetched and
+    summed here rather than loading full CandidateResult rows.
+    """
+    ids = list(submission_ids)
+    counts: Dict[int, Tuple[int, int, int]] = {}
+    if not ids:
+        return counts
+    rows = (
+        await db.execute(
+            select(CandidateResult.submission_id, CandidateResult.answers, CandidateResult.drawing_questions)
+            .where(CandidateResult.submission_id.in_(ids))
+        )
+    ).all()
+    for submission_id, ans, drw in rows:
+        candidates_count, answers_count, drawing_count = counts.get(submission_id, (0, 0, 0))
+        candidates_count += 1
+        if isinstance(ans, dict):
+            answers_count += len(ans)
+        if isinstance(drw, dict) and drw:
+            drawing_count += len(drw)
+        elif isinstance(ans, dict):
+            drawing_count += sum(1 for value in ans.values() if str(value).strip().upper() == "DR")
+        counts[submission_id] = (candidates_count, answers_count, drawing_count)
+    return counts
+
+
+async def _get_submission_or_404(db: AsyncSession, submission_id: int) -> ExamSubmission:
+    submission = await db.get(ExamSubmission, submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return submission
+
+
 @router.get("/status/{submission_id}", response_model=ProcessingStatusResponse)
-async def get_status(submission_id: int, db: Session = Depends(get_db)):
+async def get_status(submission_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get processing status of a submission
     
@@ -638,21 +835,28 @@ async def get_status(submission_id: int, db: Session = Depends(get_db)):
     Returns:
         Processing status details
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
-    
-    if not submission:
-        raise HTTPException(status_code=404, detail="Submission not found")
+    submission = await _get_submission_or_404(db, submission_id)
     
     d = submission.__dict__
     status_value = str(d.get("status") or "unknown")
 
-    # Progress log (latest page-level event)
-    progress_log = (
-        db.query(ProcessingLog)
-        .filter(ProcessingLog.submission_id == d.get("id"), ProcessingLog.action == "page_progress")
-        .order_by(ProcessingLog.created_at.desc())
-        .first()
+    # Latest progress and completion-summary logs, fetched in one round trip
+    latest_log_ids = (
+        select(func.max(ProcessingLog.id))
+        .where(
+            ProcessingLog.submission_id == d.get("id"),
+            ProcessingLog.action.in_(("page_progress", "extract_complete")),
+        )
+        .group_by(ProcessingLog.action)
     )
+    latest_logs = {
+        log.action: log
+        for log in (
+            await db.execute(select(ProcessingLog).where(ProcessingLog.id.in_(latest_log_ids)))
+        ).scalars()
+    }
+    progress_log = latest_logs.get("page_progress")
+    summary_log = latest_logs.get("extract_complete")
 
     current_page = None
     current_candidate_name = None
@@ -664,12 +868,6 @@ async def get_status(submission_id: int, db: Session = Depends(get_db)):
         )
 
     # Completion summary log (contains counters and timing)
-    summary_log = (
-        db.query(ProcessingLog)
-        .filter(ProcessingLog.submission_id == d.get("id"), ProcessingLog.action == "extract_complete")
-        .order_by(ProcessingLog.created_at.desc())
-        .first()
-    )
     summary_extra = summary_log.extra_data if summary_log is not None and isinstance(summary_log.extra_data, dict) else {}
 
     created_at = d.get("created_at")
@@ -682,24 +880,11 @@ async def get_status(submission_id: int, db: Session = Depends(get_db)):
 
     # Keep status polling lightweight while processing.
     if status_value == "completed" and cand_count == 0:
-        cand_rows = db.query(CandidateResult).filter(CandidateResult.submission_id == submission.id).all()
-        cand_count = len(cand_rows)
-        answers_count = 0
-        drawing_count = 0
-        for cr in cand_rows:
-            ans = getattr(cr, 'answers', None)
-            if isinstance(ans, dict):
-                answers_count += len(ans)
-            drw = getattr(cr, 'drawing_questions', None)
-            if isinstance(drw, dict) and drw:
-                drawing_count += len(drw)
-            elif isinstance(ans, dict):
-                drawing_count += sum(
-                    1 for value in ans.values()
-                    if str(value).strip().upper() == "DR"
-                )
+        cand_count, answers_count, drawing_count = (
+            await _answer_counts(db, [submission.id])
+        ).get(submission.id, (0, 0, 0))
 
-    return ProcessingStatusResponse(
+    return ProcessingStatusResponse.model_construct(
         submission_id=int(d.get("id") or 0),
         filename=str(d.get("filename") or ""),
         status=status_value,
@@ -716,34 +901,44 @@ async def get_status(submission_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/submission/{submission_id}", response_model=SubmissionDetailResponse)
-async def get_submission(submission_id: int, db: Session = Depends(get_db)):
+async def get_submission(submission_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get full submission details with all candidate results
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
-    
-    if not submission:
-        raise HTTPException(status_code=404, detail="Submission not found")
+    submission = await _get_submission_or_404(db, submission_id)
     
     status_value = str(getattr(submission, 'status'))
     if status_value != "completed":
         raise HTTPException(status_code=400, detail=f"Submission is {status_value}, not completed")
     
-    # Load candidate results from DB
-    candidate_rows = db.query(CandidateResult).filter(
-        CandidateResult.submission_id == submission_id
-    ).order_by(CandidateResult.page_number).all()
+    # Load candidate results from DB: only the columns the response uses,
+    # as plain rows (no ORM hydration or identity-map bookkeeping)
+    candidate_rows = (
+        await db.execute(
+            select(
+                CandidateResult.candidate_name,
+                CandidateResult.candidate_number,
+                CandidateResult.country,
+                CandidateResult.paper_type,
+                CandidateResult.extra_fields,
+                CandidateResult.answers,
+                CandidateResult.drawing_questions,
+            )
+            .where(CandidateResult.submission_id == submission_id)
+            .order_by(CandidateResult.page_number)
+        )
+    ).all()
     
     candidates = []
     for cr in candidate_rows:
         # Coerce None values in answers/drawing dicts to empty strings
-        raw_answers = getattr(cr, 'answers') or {}
+        raw_answers = cr.answers or {}
         clean_answers = {k: (str(v) if v is not None else '') for k, v in raw_answers.items()}
-        raw_drawing = getattr(cr, 'drawing_questions') or {}
+        raw_drawing = cr.drawing_questions or {}
         clean_drawing = {k: (str(v) if v is not None else '') for k, v in raw_drawing.items()}
 
         # Merge extra_fields into display: use candidate_no/candidate_id as candidate_number if empty
-        raw_extra = getattr(cr, 'extra_fields') or {}
+        raw_extra = cr.extra_fields or {}
         # Filter out internal keys and convert all values to strings for schema compatibility
         clean_extra = {}
         excluded_extra_keys = {'extra_fields', 'confidence', 'is_blank'}
@@ -751,20 +946,21 @@ async def get_submission(submission_id: int, db: Session = Depends(get_db)):
             if k not in excluded_extra_keys and v is not None and v != {}:
                 clean_extra[k] = str(v)
 
-        cand_name = str(getattr(cr, 'candidate_name') or '') or raw_extra.get('name', '') or raw_extra.get('student_name', '')
-        cand_number = str(getattr(cr, 'candidate_number') or '') or raw_extra.get('candidate_no', '') or raw_extra.get('candidate_id', '') or raw_extra.get('student_number', '')
+        cand_name = str(cr.candidate_name or '') or raw_extra.get('name', '') or raw_extra.get('student_name', '')
+        cand_number = str(cr.candidate_number or '') or raw_extra.get('candidate_no', '') or raw_extra.get('candidate_id', '') or raw_extra.get('student_number', '')
 
-        candidates.append(CandidateResultSchema(
+        # Values are already coerced to str above, so skip re-validation
+        candidates.append(CandidateResultSchema.model_construct(
             candidate_name=cand_name,
             candidate_number=cand_number,
-            country=str(getattr(cr, 'country') or ''),
-            paper_type=str(getattr(cr, 'paper_type') or ''),
+            country=str(cr.country or ''),
+            paper_type=str(cr.paper_type or ''),
             extra_fields=clean_extra if clean_extra else None,
             answers=clean_answers,
             drawing_questions=clean_drawing,
         ))
     
-    return SubmissionDetailResponse(
+    return SubmissionDetailResponse.model_construct(
         submission_id=int(getattr(submission, 'id')),
         filename=str(getattr(submission, 'filename')),
         status=str(getattr(submission, 'status')),
@@ -774,12 +970,15 @@ async def get_submission(submission_id: int, db: Session = Depends(get_db)):
     )
 
 
+MAX_SUBMISSIONS_PAGE_SIZE = 200
+
+
 @router.get("/submissions", response_model=List[ProcessingStatusResponse])
 async def list_submissions(
     skip: int = 0,
     limit: int = 100,
     status: str | None = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     List all submissions with optional filtering
@@ -791,52 +990,69 @@ async def list_submissions(
         db: Database session
         
     Returns:
-        List of submissions
+        List of submissions (at most MAX_SUBMISSIONS_PAGE_SIZE per request)
     """
-    query = db.query(ExamSubmission)
+    skip = max(skip, 0)
+    limit = max(1, min(limit, MAX_SUBMISSIONS_PAGE_SIZE))
+    cand_counts = (
+        select(
+            CandidateResult.submission_id,
+            func.count(CandidateResult.id).label("candidates_count"),
+        )
+        .group_by(CandidateResult.submission_id)
+        .subquery()
+    )
+    # Only the columns the listing needs, not full ORM entities
+    query = (
+        select(
+            ExamSubmission.id,
+            ExamSubmission.filename,
+            ExamSubmission.status,
+            ExamSubmission.created_at,
+            ExamSubmission.processed_at,
+            ExamSubmission.pages_count,
+            ExamSubmission.error_message,
+            func.coalesce(cand_counts.c.candidates_count, 0).label("candidates_count"),
+        )
+        .outerjoin(cand_counts, cand_counts.c.submission_id == ExamSubmission.id)
+    )
     
     if status:
-        query = query.filter(ExamSubmission.status == status)
+        query = query.where(ExamSubmission.status == status)
     
-    submissions = query.order_by(ExamSubmission.created_at.desc()).offset(skip).limit(limit).all()
+    rows = (
+        await db.execute(query.order_by(ExamSubmission.created_at.desc()).offset(skip).limit(limit))
+    ).all()
+    answer_counts = await _answer_counts(db, [row.id for row in rows if row.candidates_count])
     
-    results: List[ProcessingStatusResponse] = []
-    for sub in submissions:
-        # Count candidates and answers for this submission
-        cand_rows = db.query(CandidateResult).filter(CandidateResult.submission_id == sub.id).all()
-        cand_count = len(cand_rows)
-        answers_count = 0
-        drawing_count = 0
-        for cr in cand_rows:
-            ans = getattr(cr, 'answers', None)
-            if isinstance(ans, dict):
-                answers_count += len(ans)
-            drw = getattr(cr, 'drawing_questions', None)
-            if isinstance(drw, dict):
-                drawing_count += len(drw)
-        results.append(ProcessingStatusResponse(
-            submission_id=int(getattr(sub,'id')),
-            filename=str(getattr(sub,'filename')),
-            status=str(getattr(sub,'status')),
-            created_at=getattr(sub,'created_at'),
-            processed_at=getattr(sub,'processed_at'),
-            pages_count=int(getattr(sub,'pages_count') or 0),
-            candidates_count=cand_count,
-            answers_count=answers_count,
-            drawing_count=drawing_count,
-            error_message=str(getattr(sub,'error_message')) if getattr(sub,'error_message') is not None else None
-        ))
-    return results
+    # Rows come straight from our own tables: serialize plain dicts with orjson
+    # directly instead of building response models and re-encoding them
+    results = []
+    for row in rows:
+        _, answers_count, drawing_count = answer_counts.get(row.id, (0, 0, 0))
+        results.append({
+            "submission_id": row.id,
+            "filename": row.filename,
+            "status": row.status,
+            "created_at": row.created_at,
+            "processed_at": row.processed_at,
+            "pages_count": row.pages_count or 0,
+            "candidates_count": row.candidates_count,
+            "answers_count": answers_count,
+            "drawing_count": drawing_count,
+            "error_message": row.error_message,
+            "current_page": None,
+            "current_candidate_name": None,
+        })
+    return ORJSONResponse(content=results)
 
 
 @router.get("/submission/{submission_id}/json")
-async def get_submission_json(submission_id: int, db: Session = Depends(get_db)):
+async def get_submission_json(submission_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Get the raw JSON result file for a submission
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
-    if not submission:
-        raise HTTPException(status_code=404, detail="Submission not found")
+    submission = await _get_submission_or_404(db, submission_id)
     result_key = getattr(submission,'result_json_key', None)
     if result_key is None or str(result_key).strip() == "":
         raise HTTPException(status_code=404, detail="JSON result not found")
@@ -844,38 +1060,43 @@ async def get_submission_json(submission_id: int, db: Session = Depends(get_db))
         storage = get_local_storage()
         key = getattr(submission, 'result_json_key')
         logger.info(f"Loading JSON for submission {submission_id} from {key}")
-        json_data = storage.read_json(key)
-        if json_data is None:
+        # Clients that accept zstd get the stored compressed bytes untouched
+        if storage.is_compressed(key) and "zstd" in request.headers.get("accept-encoding", "").lower():
+            compressed = await run_in_threadpool(storage.read_bytes, key)
+            if compressed is None:
+                raise HTTPException(status_code=404, detail="JSON result file not found in storage.")
+            return Response(
+                content=compressed,
+                media_type="application/json",
+                headers={"Content-Encoding": "zstd", "Vary": "Accept-Encoding"},
+            )
+        json_bytes = await run_in_threadpool(storage.read_json_bytes, key)
+        if json_bytes is None:
             raise HTTPException(status_code=404, detail="JSON result file not found in storage.")
-        # Parse JSON string and return as proper JSON response
-        try:
-            parsed = _json.loads(json_data)
-            return JSONResponse(content=parsed)
-        except _json.JSONDecodeError:
-            # If parsing fails, log and return the raw string as text with application/json media type
-            logger.error(f"Downloaded JSON is invalid JSON for submission {submission_id}")
-            return JSONResponse(content={"raw": json_data})
+        # Stored results are already serialized JSON; pass the bytes through as-is
+        return Response(content=json_bytes, media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to retrieve JSON for {submission_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve JSON: {str(e)}")
 
 
 @router.get("/submission/{submission_id}/logs")
-async def get_submission_logs(submission_id: int, limit: int = 10, db: Session = Depends(get_db)):
+async def get_submission_logs(submission_id: int, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
     """
     Return the most recent processing logs for a submission.
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
-    if not submission:
-        raise HTTPException(status_code=404, detail="Submission not found")
+    await _get_submission_or_404(db, submission_id)
 
     logs = (
-        db.query(ProcessingLog)
-        .filter(ProcessingLog.submission_id == submission_id)
-        .order_by(ProcessingLog.created_at.desc())
-        .limit(limit)
-        .all()
-    )
+        await db.execute(
+            select(ProcessingLog)
+            .where(ProcessingLog.submission_id == submission_id)
+            .order_by(ProcessingLog.created_at.desc())
+            .limit(limit)
+        )
+    ).scalars().all()
     out = []
     for log in logs:
         dt = getattr(log, 'created_at', None)
@@ -891,7 +1112,7 @@ async def get_submission_logs(submission_id: int, limit: int = 10, db: Session =
 
 
 @router.delete("/submission/{submission_id}")
-async def delete_submission(submission_id: int, db: Session = Depends(get_db)):
+def delete_submission(submission_id: int, db: Session = Depends(get_db)):
     """
     Delete a submission and all associated data
     
@@ -902,79 +1123,131 @@ async def delete_submission(submission_id: int, db: Session = Depends(get_db)):
     Returns:
         Deletion confirmation
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
+    row = db.execute(
+        select(ExamSubmission.result_json_key)
+        .where(ExamSubmission.id == submission_id)
+    ).first()
     
-    if not submission:
+    if not row:
         raise HTTPException(status_code=404, detail="Submission not found")
     
-    storage = get_local_storage()
-    storage.delete_file(getattr(submission, 'original_pdf_key', None))
-    if getattr(submission, 'result_json_key', None):
-        storage.delete_file(getattr(submission, 'result_json_key'))
-    
-    # Delete from database (cascades to answers)
-    db.delete(submission)
+    # Single DELETE; answers, candidates and logs go via ON DELETE CASCADE
+    db.execute(delete(ExamSubmission).where(ExamSubmission.id == submission_id))
     db.commit()
     
+    # Only the per-submission result is removed, and only once the row is gone.
+    # Uploaded PDFs are content-addressed and may be shared by other rows,
+    # concurrent uploads or /extract/json, so they are left in place.
+    get_local_storage().delete_file(row.result_json_key)
+    
     logger.info(f"Deleted submission {submission_id}")
     
     return {"status": "success", "message": f"Submission {submission_id} deleted"}
 
 
+# Single-flight registry for /extract/json: concurrent requests for the same
+# PDF (by SHA-256) await the first request's result instead of re-extracting.
+_inflight_extractions: Dict[str, asyncio.Future] = {}
+_inflight_lock = asyncio.Lock()
+
+
+def _extract_pdf_to_json(pdf_path: str, pdf_sha256: str, filename: str) -> bytes:
+    """Blocking convert → extract → validate → JSON pipeline behind /extract/json."""
+    pdf_converter = get_pdf_converter()
+    ai_extractor = get_ai_extractor()
+    settings = get_settings()
+    cache = get_extraction_cache()
+    cache_key = None
+    cache_config = _extraction_cache_config(ai_extractor)
+    cached = None
+    if cache is not None:
+        cache_key = ExtractionCache.make_key(pdf_sha256, **cache_config)
+        cached = cache.get(cache_key)
+
+    if cached:
+        extraction_result = cached["extraction_result"]
+        validation_result = cached["validation_result"]
+    else:
+        with tempfile.TemporaryDirectory(prefix=f"sync_extract_{pdf_sha256[:12]}_") as work_dir:
+            image_paths = pdf_converter.convert_from_file(pdf_path, output_dir=work_dir)
+
+            _save_ocr_results(
+                image_paths=image_paths,
+                context_id=f"sync_extract_{Path(filename).stem}",
+                source_filename=filename,
+            )
+
+            # Run extraction with parallel processing
+            extraction_result = ai_extractor.extract_from_multiple_images(
+                image_paths,
+                extraction_prompt=None,
+                submission_id=None,
+                db=None,
+                use_parallel=settings.use_parallel_extraction,
+                max_workers=_extraction_workers(len(image_paths))
+            )
+            validation_result = ai_extractor.validate_extraction(extraction_result)
+            if cache is not None and cache_key and extraction_result.get("pages_with_data"):
+                cache.put(cache_key, extraction_result, validation_result, config=cache_config)
+
+    # Generate structured JSON
+    json_generator = get_json_generator()
+    # Compact output: this endpoint is consumed by code, not read by people
+    json_data = json_generator.generate_with_validation(
+        filename,
+        extraction_result,
+        validation_result,
+        indent=False,
+    )
+
+    return json_data.encode("utf-8")
+
+
 @router.post("/extract/json")
 async def extract_json(file: UploadFile = File(...)):
     """Synchronous PDF → JSON extraction endpoint for third-party use.
 
     Accepts a PDF upload and returns structured JSON immediately without
-    creating DB records or using background tasks.
+    creating DB records or using background tasks. Identical PDFs uploaded
+    concurrently share a single extraction.
     """
     # Validate file
     if not file or not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    await _validate_pdf_upload(file)
     try:
-        # Convert PDF to images
-        pdf_converter = get_pdf_converter()
         # Save to a temporary path under local storage uploads for consistency
         storage = get_local_storage()
-        saved = storage.save_pdf(file.file, file.filename)
-        image_paths = pdf_converter.convert_from_file(saved["absolute_path"]) 
-
-        _save_ocr_results(
-            image_paths=image_paths,
-            context_id=f"sync_extract_{Path(file.filename).stem}",
-            source_filename=file.filename,
-        )
-
-        # Run extraction with parallel processing
-        ai_extractor = get_ai_extractor()
-        settings = get_settings()
-        extraction_result = ai_extractor.extract_from_multiple_images(
-            image_paths,
-            extraction_prompt=None,
-            submission_id=None,
-            db=None,
-            use_parallel=settings.use_parallel_extraction,
-            max_workers=settings.max_extraction_workers
-        )
-        validation_result = ai_extractor.validate_extraction(extraction_result)
+        saved = await storage.save_pdf_async(file, file.filename)
+        pdf_sha256 = saved["sha256"]
 
-        # Generate structured JSON
-        json_generator = get_json_generator()
-        json_data = json_generator.generate_with_validation(
-            file.filename,
-            extraction_result,
-            validation_result,
-        )
+        async with _inflight_lock:
+            pending = _inflight_extractions.get(pdf_sha256)
+            if pending is None:
+                future = asyncio.get_running_loop().create_future()
+                _inflight_extractions[pdf_sha256] = future
 
-        # Cleanup images
-        for img in image_paths:
-            try:
-                Path(img).unlink(missing_ok=True)
-            except Exception:
-                pass
+        if pending is not None:
+            logger.info(f"Joining in-flight extraction for {file.filename} ({pdf_sha256[:12]})")
+            return Response(content=await asyncio.shield(pending), media_type="application/json")
 
-        # Return parsed JSON
-        return JSONResponse(content=_json.loads(json_data))
+        try:
+            result = await run_in_threadpool(
+                _extract_pdf_to_json, saved["absolute_path"], pdf_sha256, file.filename
+            )
+            future.set_result(result)
+        except BaseException as exc:
+            if not future.done():
+                future.set_exception(exc if isinstance(exc, Exception) else RuntimeError("Extraction cancelled"))
+                # Mark retrieved so an unshared failure doesn't warn at GC time
+                future.exception()
+            raise
+        finally:
+            async with _inflight_lock:
+                _inflight_extractions.pop(pdf_sha256, None)
+
+        # Return the generated JSON without a parse/re-serialize round trip
+        return Response(content=result, media_type="application/json")
     except Exception as e:
         logger.error(f"Synchronous extraction failed: {e}")
         raise HTTPException(status_code=500, detail=f"Extraction failed: {e}")
@@ -983,7 +1256,7 @@ async def extract_json(file: UploadFile = File(...)):
 # ── Answer Key CRUD ──────────────────────────────────────────────────
 
 @router.post("/answer-keys", response_model=AnswerKeyResponse)
-async def create_answer_key(body: AnswerKeySchema, db: Session = Depends(get_db)):
+def create_answer_key(body: AnswerKeySchema, db: Session = Depends(get_db)):
     """Create a new answer key for auto-marking."""
     ak = AnswerKey(
         name=body.name,
@@ -995,59 +1268,29 @@ async def create_answer_key(body: AnswerKeySchema, db: Session = Depends(get_db)
     db.add(ak)
     db.commit()
     db.refresh(ak)
-    return AnswerKeyResponse(
-        id=int(getattr(ak, 'id')),
-        name=str(getattr(ak, 'name')),
-        paper_type=getattr(ak, 'paper_type'),
-        answers=getattr(ak, 'answers'),
-        drawing_key=getattr(ak, 'drawing_key'),
-        total_questions=getattr(ak, 'total_questions'),
-        created_at=getattr(ak, 'created_at'),
-        updated_at=getattr(ak, 'updated_at'),
-    )
+    return AnswerKeyResponse.model_validate(ak)
 
 
 @router.get("/answer-keys", response_model=List[AnswerKeyResponse])
-async def list_answer_keys(db: Session = Depends(get_db)):
+def list_answer_keys(db: Session = Depends(get_db)):
     """List all answer keys."""
     keys = db.query(AnswerKey).order_by(AnswerKey.created_at.desc()).all()
-    return [
-        AnswerKeyResponse(
-            id=int(getattr(ak, 'id')),
-            name=str(getattr(ak, 'name')),
-            paper_type=getattr(ak, 'paper_type'),
-            answers=getattr(ak, 'answers'),
-            drawing_key=getattr(ak, 'drawing_key'),
-            total_questions=getattr(ak, 'total_questions'),
-            created_at=getattr(ak, 'created_at'),
-            updated_at=getattr(ak, 'updated_at'),
-        )
-        for ak in keys
-    ]
+    return [AnswerKeyResponse.model_validate(ak) for ak in keys]
 
 
 @router.get("/answer-keys/{key_id}", response_model=AnswerKeyResponse)
-async def get_answer_key(key_id: int, db: Session = Depends(get_db)):
+def get_answer_key(key_id: int, db: Session = Depends(get_db)):
     """Get a single answer key."""
-    ak = db.query(AnswerKey).filter(AnswerKey.id == key_id).first()
+    ak = db.get(AnswerKey, key_id)
     if not ak:
         raise HTTPException(status_code=404, detail="Answer key not found")
-    return AnswerKeyResponse(
-        id=int(getattr(ak, 'id')),
-        name=str(getattr(ak, 'name')),
-        paper_type=getattr(ak, 'paper_type'),
-        answers=getattr(ak, 'answers'),
-        drawing_key=getattr(ak, 'drawing_key'),
-        total_questions=getattr(ak, 'total_questions'),
-        created_at=getattr(ak, 'created_at'),
-        updated_at=getattr(ak, 'updated_at'),
-    )
+    return AnswerKeyResponse.model_validate(ak)
 
 
 @router.delete("/answer-keys/{key_id}")
-async def delete_answer_key(key_id: int, db: Session = Depends(get_db)):
+def delete_answer_key(key_id: int, db: Session = Depends(get_db)):
     """Delete an answer key."""
-    ak = db.query(AnswerKey).filter(AnswerKey.id == key_id).first()
+    ak = db.get(AnswerKey, key_id)
     if not ak:
         raise HTTPException(status_code=404, detail="Answer key not found")
     db.delete(ak)
@@ -1058,7 +1301,7 @@ async def delete_answer_key(key_id: int, db: Session = Depends(get_db)):
 # ── Auto-marking endpoints ───────────────────────────────────────────
 
 @router.post("/submission/{submission_id}/mark")
-async def mark_submission(
+def mark_submission(
     submission_id: int,
     body: MarkRequest,
     db: Session = Depends(get_db)
@@ -1068,7 +1311,7 @@ async def mark_submission(
     
     Provide EITHER answer_key_id (to use a stored key) OR inline answer_key dict.
     """
-    submission = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
+    submission = db.get(ExamSubmission, submission_id)
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
     if str(getattr(submission, 'status')) != "completed":
@@ -1165,26 +1408,31 @@ async def extract_and_mark(
     """
     if not file or not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    await _validate_pdf_upload(file)
     try:
         # Extract
         pdf_converter = get_pdf_converter()
         storage = get_local_storage()
-        saved = storage.save_pdf(file.file, file.filename)
-        image_paths = pdf_converter.convert_from_file(saved["absolute_path"])
-
-        _save_ocr_results(
-            image_paths=image_paths,
-            context_id=f"sync_extract_mark_{Path(file.filename).stem}",
-            source_filename=file.filename,
-        )
+        saved = await storage.save_pdf_async(file, file.filename)
+
+        def _convert_and_extract():
+            with tempfile.TemporaryDirectory(prefix="sync_extract_mark_") as work_dir:
+                image_paths = pdf_converter.convert_from_file(saved["absolute_path"], output_dir=work_dir)
+                _save_ocr_results(
+                    image_paths=image_paths,
+                    context_id=f"sync_extract_mark_{Path(file.filename).stem}",
+                    source_filename=file.filename,
+                )
+                ai_extractor = get_ai_extractor()
+                settings = get_settings()
+                return ai_extractor.extract_from_multiple_images(
+                    image_paths,
+                    use_parallel=settings.use_parallel_extraction,
+                    max_workers=_extraction_workers(len(image_paths)),
+                )
 
-        ai_extractor = get_ai_extractor()
-        settings = get_settings()
-        extraction_result = ai_extractor.extract_from_multiple_images(
-            image_paths,
-            use_parallel=settings.use_parallel_extraction,
-            max_workers=settings.max_extraction_workers,
-        )
+        # Rasterization and model calls block; keep them off the event loop
+        extraction_result = await run_in_threadpool(_convert_and_extract)
 
         candidates = extraction_result.get("candidates", [])
         json_gen = get_json_generator()
@@ -1193,15 +1441,14 @@ async def extract_and_mark(
         inline_answer_key = None
         inline_drawing_key = None
         if mark_request:
-            import json as _j
             try:
-                mr = _j.loads(mark_request)
-            except _j.JSONDecodeError:
+                mr = json.loads(mark_request)
+            except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="Invalid mark_request JSON")
             
             # If answer_key_id provided, load from DB
             if mr.get("answer_key_id"):
-                ak = db.query(AnswerKey).filter(AnswerKey.id == mr["answer_key_id"]).first()
+                ak = await run_in_threadpool(db.get, AnswerKey, mr["answer_key_id"])
                 if not ak:
                     raise HTTPException(status_code=404, detail=f"Answer key {mr['answer_key_id']} not found")
                 inline_answer_key = getattr(ak, 'answers') or {}
@@ -1219,7 +1466,7 @@ async def extract_and_mark(
             )
         else:
             # Auto-match by paper_type from stored answer keys
-            all_keys = db.query(AnswerKey).all()
+            all_keys = await run_in_threadpool(lambda: db.query(AnswerKey).all())
             keys_by_type = {}
             for ak in all_keys:
                 pt = str(getattr(ak, 'paper_type') or '').strip().upper()
@@ -1248,14 +1495,7 @@ async def extract_and_mark(
                 else:
                     marked_candidates.append(candidate)
 
-        # Cleanup images
-        for img in image_paths:
-            try:
-                Path(img).unlink(missing_ok=True)
-            except Exception:
-                pass
-
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "filename": file.filename,
             "total_candidates": len(marked_candidates),
             "candidates": marked_candidates,
@@ -109,6 +109,10 @@ class UploadResponse(BaseModel):
     submission_id: int
     filename: str
     storage_path: str
+    task_id: Optional[str] = None  # Celery task id when queued on the worker
+
+    class Config:
+        from_attributes = True
 
 
 class ProcessingStatusResponse(BaseModel):
@@ -126,6 +130,9 @@ class ProcessingStatusResponse(BaseModel):
     current_page: Optional[int] = None
     current_candidate_name: Optional[str] = None
 
+    class Config:
+        from_attributes = True
+
 
 class SubmissionDetailResponse(BaseModel):
     """Schema for submission details with candidate results"""
@@ -37,10 +37,19 @@ class Settings(BaseSettings):
     
     # PDF Processing
     poppler_path: Optional[str] = None  # Optional: Path to Poppler binaries
+    pdf_render_dpi: int = 200  # Page raster resolution; pixel count (and model upload size) scales with DPI^2
+    pdf_render_format: str = "PNG"  # PNG (lossless) or JPEG (much smaller pages)
+    pdf_jpeg_quality: int = 80
+    model_image_max_edge: int = 2048  # Longest edge of page images sent by the legacy extractor
+    model_image_jpeg_quality: int = 90
     
     # AI Extraction Performance
     use_parallel_extraction: bool = True  # Enable multi-threading for faster extraction
     max_extraction_workers: int = 2  # Number of parallel workers for page processing
+    extraction_batch_size: int = 4  # Pages per Gemini call in the legacy pipeline (1 = one call per page)
+    max_concurrent_pdfs: int = 1  # Uploaded PDFs processed at once (each in its own worker process)
+    # Hand uploads to the Celery worker (backend.worker) instead of the API's process pool
+    use_celery_worker: bool = False
 
     # NEW: Use optimized pipeline (CV preprocessing + token optimization)
     use_optimized_pipeline: bool = True  # Set to False to use legacy pipeline
@@ -48,9 +57,18 @@ class Settings(BaseSettings):
     # Output format
     minimal_output: bool = True  # Generate minimal JSON output (answers + identifiers only)
 
+    # Store result JSON zstd-compressed (.json.zst); requires the zstandard package
+    compress_json_results: bool = True
+
+    # Extraction result cache (skips the whole pipeline for identical PDFs)
+    extraction_cache_enabled: bool = True
+    extraction_cache_dir: str = "./cache"
+
     # Prompt caching (to reduce repeated format analysis)
     cache_page_prompts: bool = True
     page_hash_size: int = 16
+    # Provider-side context cache TTL for template few-shot examples (0 disables)
+    template_context_cache_ttl_minutes: int = 60
 
     # Image preprocessing (improves contrast/clarity before extraction)
     enable_image_preprocessing: bool = True
@@ -0,0 +1,100 @@
+"""
+Async database engine and session management for API request handlers.
+Background extraction (process pool / Celery) keeps using the sync SessionLocal.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import AsyncIterator
+import logging
+
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Async driver to use for each sync database backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+# libpq/psycopg2 query parameters and their asyncpg connect() equivalents
+ASYNCPG_QUERY_RENAMES = {
+    "sslmode": "ssl",
+    "connect_timeout": "timeout",
+}
+# libpq-only parameters asyncpg rejects as unexpected keyword arguments
+LIBPQ_ONLY_QUERY_PARAMS = {
+    "application_name",
+    "channel_binding",
+    "gssencmode",
+    "keepalives",
+    "keepalives_count",
+    "keepalives_idle",
+    "keepalives_interval",
+    "options",
+    "sslcert",
+    "sslcrl",
+    "sslkey",
+    "sslrootcert",
+}
+
+
+def _asyncpg_query(query: dict) -> dict:
+    """Translate a psycopg2 URL query for asyncpg, dropping what it cannot take."""
+    translated = {}
+    for key, value in query.items():
+        if key in LIBPQ_ONLY_QUERY_PARAMS:
+            logger.warning("Ignoring DATABASE_URL parameter %r for the async engine (not supported by asyncpg)", key)
+            continue
+        translated[ASYNCPG_QUERY_RENAMES.get(key, key)] = value
+    return translated
+
+
+def to_async_database_url(database_url: str) -> str:
+    """Rewrite a sync DATABASE_URL (e.g. postgresql://, sqlite:///) for its async driver."""
+    url = make_url(database_url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        return database_url
+    url = url.set(drivername=drivername)
+    if drivername == "postgresql+asyncpg" and url.query:
+        url = url.set(query=_asyncpg_query(dict(url.query)))
+    return url.render_as_string(hide_password=False)
+
+
+settings = get_settings()
+async_database_url = to_async_database_url(settings.database_url)
+is_sqlite = async_database_url.startswith("sqlite")
+
+async_engine_kwargs = {
+    "pool_pre_ping": True,
+    "echo": settings.debug,
+}
+if is_sqlite:
+    async_engine_kwargs["connect_args"] = {"timeout": 30}
+
+async_engine = create_async_engine(async_database_url, **async_engine_kwargs)
+
+if is_sqlite:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA busy_timeout=30000;")
+            cursor.execute("PRAGMA foreign_keys=ON;")
+        finally:
+            cursor.close()
+
+# Objects stay readable after commit without an implicit (blocking) refresh
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency function to get an async database session
+    Yields a session and closes it after use
+    """
+    async with async_session_maker() as db:
+        yield db
@@ -2,6 +2,7 @@
 Database connection and session management
 """
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from backend.config import get_settings
@@ -27,6 +28,14 @@ if is_sqlite:
         "check_same_thread": False,
         "timeout": 30,
     }
+elif make_url(database_url).get_driver_name() == "psycopg2":
+    # Batch UPDATE/DELETE executemany with execute_batch, and pack
+    # INSERT executemany into multi-row VALUES pages
+    engine_kwargs.update(
+        executemany_mode="values_plus_batch",
+        insertmanyvalues_page_size=1000,
+        executemany_batch_page_size=500,
+    )
 
 engine = create_engine(database_url, **engine_kwargs)
 
@@ -62,6 +71,11 @@ def init_db():
     """Initialize database tables"""
     logger.info("Initializing database tables...")
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes declared
+    # since those tables were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     logger.info("Database tables created successfully")
 
 
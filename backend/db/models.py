@@ -1,7 +1,8 @@
 """
 Database models for exam answers
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey, Float, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.db.database import Base
@@ -10,23 +11,36 @@ from backend.db.database import Base
 class ExamSubmission(Base):
     """Model for exam submission metadata"""
     __tablename__ = "exam_submissions"
+    __table_args__ = (
+        # /submissions filters by status and orders by newest first; this also
+        # serves plain status lookups, so status has no index of its own
+        Index("ix_exam_submissions_status_created", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String(255), nullable=False, index=True)
     original_pdf_key = Column(String(500), nullable=False)  # local storage path
     result_json_key = Column(String(500), nullable=True)  # local storage path for results
-    status = Column(String(50), default="pending", index=True)  # pending, processing, completed, failed
-    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String(50), default="pending")  # pending, processing, completed, failed
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     processed_at = Column(DateTime, nullable=True)
     pages_count = Column(Integer, default=0)
     error_message = Column(Text, nullable=True)
     
     # Relationships
-    candidate_results = relationship("CandidateResult", back_populates="submission", cascade="all, delete-orphan")
+    # passive_deletes: child rows are removed by the FK's ON DELETE CASCADE
+    # rather than loaded and deleted one by one
+    candidate_results = relationship("CandidateResult", back_populates="submission", cascade="all, delete-orphan", passive_deletes=True)
     
     # Keep legacy relationships for backward compatibility during migration
-    mcq_answers = relationship("MultipleChoiceAnswer", back_populates="submission", cascade="all, delete-orphan")
-    free_responses = relationship("FreeResponseAnswer", back_populates="submission", cascade="all, delete-orphan")
+    mcq_answers = relationship(
+        "MultipleChoiceAnswer", back_populates="submission", cascade="all, delete-orphan",
+        passive_deletes=True, order_by="MultipleChoiceAnswer.question_number",
+    )
+    free_responses = relationship(
+        "FreeResponseAnswer", back_populates="submission", cascade="all, delete-orphan",
+        passive_deletes=True, order_by="FreeResponseAnswer.question_number",
+    )
     
     def __repr__(self):
         return f"<ExamSubmission(id={self.id}, filename='{self.filename}', status='{self.status}')>"
@@ -41,6 +55,10 @@ class CandidateResult(Base):
     stored in the ``extra_fields`` JSON column.
     """
     __tablename__ = "candidate_results"
+    __table_args__ = (
+        # Per-submission listing ordered by page
+        Index("ix_candidate_results_submission_page", "submission_id", "page_number"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     submission_id = Column(Integer, ForeignKey("exam_submissions.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -177,13 +195,20 @@ class FreeResponseAnswer(Base):
 class ProcessingLog(Base):
     """Model for processing logs and audit trail"""
     __tablename__ = "processing_logs"
+    __table_args__ = (
+        # Latest log per action for /status (MAX(id) grouped by action)
+        Index("ix_processing_logs_submission_action_id", "submission_id", "action", "id"),
+        # Most recent logs for /submission/{id}/logs
+        Index("ix_processing_logs_submission_created", "submission_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     submission_id = Column(Integer, ForeignKey("exam_submissions.id", ondelete="CASCADE"), nullable=True, index=True)
     action = Column(String(100), nullable=False)
     status = Column(String(50), nullable=False)
     message = Column(Text, nullable=True)
-    extra_data = Column(JSON, nullable=True)
+    # Binary JSONB on PostgreSQL (no re-parse on read, GIN-indexable); plain JSON elsewhere
+    extra_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     def __repr__(self):
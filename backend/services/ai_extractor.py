@@ -2,21 +2,242 @@
 AI Extractor Service
 Uses Google Gemini Vision API for intelligent answer extraction from exam sheets.
 """
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, BinaryIO, List, Dict, Optional, Set, Tuple, Union
+import io
 import logging
 import json
 import re
+import shutil
+import threading
 import time
 import os
 from PIL import Image
 import hashlib
 
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import caching as genai_caching
+import google.generativeai as genai
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
 from backend.config import get_settings
-from backend.services.gemini_client import create_gemini_model
-from backend.services.image_preprocessor import ImagePreprocessor
+from backend.db.models import ProcessingLog
+from backend.services.extraction_cache import get_extraction_cache, hash_file
+from backend.services.gemini_client import create_gemini_model, get_gemini_model
+from backend.services.image_preprocessor import ImagePreprocessor, MAX_MODEL_IMAGE_DIMENSION
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever a prompt below changes so cached extractions are invalidated.
+PROMPT_VERSION = "legacy-4"
+
+# Static rules shared by every page, sent once as the extraction model's
+# system instruction so per-page prompts carry only the sheet-specific schema.
+EXTRACTION_SYSTEM_INSTRUCTION = (
+    "You are analyzing an exam answer sheet. Extract ALL data with high accuracy.\n\n"
+    "GENERAL RULES:\n"
+    "- Return ONLY the JSON object described below, no extra text.\n"
+    "- Read candidate identifiers carefully (handwriting and boxed digits).\n"
+    "- If a header field is not visible, return an empty string.\n"
+    "- A mark can be X/fill/shade/check/tick/dot or a colored box under the option label.\n"
+    "- Pay close attention to marked option areas (bubble/box/colored area under option label).\n"
+    "- Do not infer by position index alone; use the visible printed option labels.\n"
+    '- For every MCQ question in the range, include an entry. Use "BL" if blank.\n'
+    '- Use "IN" for invalid (two or more options marked).\n'
+)
+
+# Model replies sometimes wrap the JSON in a ```json fenced block
+_JSON_BLOCK_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+# Characters of a streamed reply inspected before deciding it is not JSON at all
+_JSON_PROBE_CHARS = 64
+
+
+# Finish reasons of a reply that ended normally; any other reason (SAFETY,
+# RECITATION, ...) means the reply was blocked or cut off.
+_NORMAL_FINISH_REASONS = frozenset({"FINISH_REASON_UNSPECIFIED", "STOP", "MAX_TOKENS"})
+
+# Failures of the stream itself, worth one retry without streaming. Quota,
+# auth and request errors are not: retrying them only adds load.
+_STREAM_FALLBACK_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Gemini JSON mode: replies are bare JSON (no fences or prose) for every extraction call
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Extra attempts for a page whose reply fails validation, each told what was wrong
+MAX_FEEDBACK_RETRIES = 2
+
+
+class _PageExtraction(BaseModel):
+    """Shape every page reply must have; header fields vary by format and pass through."""
+
+    model_config = ConfigDict(extra="allow")
+
+    answers: Dict[str, Any] = {}
+    drawing_questions: Dict[str, Any] = {}
+
+
+def _blocked_reason(response) -> Optional[str]:
+    """Why a (chunk of a) generate_content reply was blocked, or None if it was not."""
+    feedback = getattr(response, "prompt_feedback", None)
+    block_reason = getattr(feedback, "block_reason", None)
+    if block_reason:
+        return f"prompt blocked ({getattr(block_reason, 'name', block_reason)})"
+    for candidate in getattr(response, "candidates", None) or ():
+        finish_reason = getattr(candidate, "finish_reason", None)
+        name = getattr(finish_reason, "name", str(finish_reason))
+        if finish_reason and name not in _NORMAL_FINISH_REASONS:
+            return f"reply stopped ({name})"
+    return None
+
+
+def _generate_text(model, parts: List, generation_config: Optional[Dict] = JSON_GENERATION_CONFIG) -> str:
+    """Stream a generate_content reply and return its text.
+
+    Reading stops as soon as the reply clearly is not JSON (no object, array
+    or fenced block opened within its first characters), so a rambling
+    answer does not hold the worker for the rest of the generation. A
+    blocked reply raises instead of coming back empty. If the stream itself
+    fails before any text arrives, the call is made once without streaming.
+    """
+    chunks: List[str] = []
+    probed = False
+    try:
+        for chunk in model.generate_content(parts, generation_config=generation_config, stream=True):
+            blocked = _blocked_reason(chunk)
+            if blocked:
+                raise RuntimeError(f"Gemini {blocked}")
+            try:
+                chunks.append(chunk.text)
+            except ValueError:
+                # No text parts and a normal finish (e.g. the final finish_reason chunk)
+                continue
+            if not probed:
+                head = "".join(chunks).lstrip()
+                if len(head) >= _JSON_PROBE_CHARS:
+                    probed = True
+                    if not any(token in head for token in ("{", "[", "```")):
+                        logger.warning("Reply is not JSON; stopping stream early: %s", head[:_JSON_PROBE_CHARS])
+                        break
+    except _STREAM_FALLBACK_ERRORS as e:
+        if chunks:
+            raise
+        logger.warning("Streaming call failed (%s: %s); retrying without streaming", type(e).__name__, e)
+        response = model.generate_content(parts, generation_config=generation_config)
+        blocked = _blocked_reason(response)
+        if blocked:
+            raise RuntimeError(f"Gemini {blocked}")
+        return response.text
+    return "".join(chunks)
+
+
+def _json_loads(data):
+    """Decode JSON from str or bytes, with orjson when available.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj, pretty: bool = False) -> bytes:
+    """Encode obj as UTF-8 JSON, indented by two spaces when pretty."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _parse_json_response(content: str, context: str = "") -> Optional[Dict]:
+    """Parse a model reply as JSON, falling back to a fenced block; None if neither parses.
+
+    With a context (e.g. the page file name) a parse failure is logged here.
+    """
+    text = content.strip()
+    # Replies usually arrive wrapped in a ```json fence: slice it off instead of
+    # paying for a failed parse first.
+    if text.startswith("```"):
+        text = text.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    try:
+        return _json_loads(text)
+    except json.JSONDecodeError:
+        m = _JSON_BLOCK_RE.search(content)
+        if m:
+            try:
+                return _json_loads(m.group(1))
+            except json.JSONDecodeError:
+                pass
+    if context:
+        logger.error("JSON parse failed for %s. Raw: %s", context, content[:300])
+    return None
+
+
+def _example_numbers(template_path: str, with_image: bool = False) -> List[int]:
+    """Sorted N of every example_N.json in a template directory (and example_N.png, if with_image)."""
+    json_numbers = set()
+    image_numbers = set()
+    with os.scandir(template_path) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if not stem.startswith("example_") or not stem[len("example_"):].isdigit() or not entry.is_file():
+                continue
+            if ext == ".json":
+                json_numbers.add(int(stem[len("example_"):]))
+            elif ext == ".png":
+                image_numbers.add(int(stem[len("example_"):]))
+    return sorted(json_numbers & image_numbers if with_image else json_numbers)
+
+
+def _template_signature(template_path: str) -> int:
+    """Latest mtime (ns) of a template directory and its example files; 0 if missing."""
+    if not os.path.isdir(template_path):
+        return 0
+    latest = os.stat(template_path).st_mtime_ns
+    with os.scandir(template_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("example_"):
+                latest = max(latest, entry.stat().st_mtime_ns)
+    return latest
+
+
+@lru_cache(maxsize=8)
+def _load_template_examples(template_path: str, signature: int) -> Tuple[Tuple[str, Image.Image, str], ...]:
+    """Decode a template's example images and pre-serialize their expected JSON.
+
+    Cached per (directory, signature) so repeated extractions with the same
+    template skip the disk reads and PNG decodes; any added or edited example
+    changes the signature and reloads the set.
+    """
+    if not signature:
+        return ()
+    examples = []
+    for number in _example_numbers(template_path, with_image=True):
+        image_path = os.path.join(template_path, f"example_{number}.png")
+        image = ImagePreprocessor.open_for_model(image_path)
+        with open(os.path.join(template_path, f"example_{number}.json"), "rb") as fh:
+            expected = _json_dumps(_json_loads(fh.read()), pretty=True).decode("utf-8")
+        examples.append((image_path, image, expected))
+    logger.info("Loaded %d template examples from %s", len(examples), template_path)
+    return tuple(examples)
+
+
 DEFAULT_FORMAT = {
     "header_fields": [
         {"key": "candidate_name", "label": "Candidate Name"},
@@ -30,10 +251,16 @@ DEFAULT_FORMAT = {
     "description": "Standard bubble-sheet with MCQ + drawing questions",
 }
 
+# Markers valid for any MCQ question regardless of the sheet's option labels
+_VALID_MARKS = frozenset({"BL", "IN"})
+_DEFAULT_VALID_ANSWERS = frozenset(DEFAULT_FORMAT["answer_options"]) | _VALID_MARKS
+
 
 class AIExtractor:
     """AI-powered extractor using Google Gemini Vision API with dynamic format detection"""
 
+    prompt_version = PROMPT_VERSION
+
     def __init__(self, template_dir: Optional[str] = None):
         settings = get_settings()
         self.model, self.model_name = create_gemini_model(
@@ -43,13 +270,40 @@ class AIExtractor:
         self.template_dir = template_dir or os.path.join(
             os.path.dirname(__file__), "templates"
         )
+        self.extraction_model = get_gemini_model(self.model_name, EXTRACTION_SYSTEM_INSTRUCTION)
         self._format_cache: Dict[str, Dict] = {}
         self._prompt_cache: Dict[str, str] = {}
         self._use_prompt_cache = settings.cache_page_prompts
         self._page_hash_size = settings.page_hash_size
+        self.batch_size = max(1, settings.extraction_batch_size)
+        # template_name -> (template signature, monotonic expiry, cached model or None, CachedContent or None)
+        self._template_cache: Dict[str, Tuple[int, float, Any, Any]] = {}
+        # template_name -> (template signature, earliest expiry, uploaded File handles or None)
+        self._template_files: Dict[str, Tuple[int, datetime, Optional[List[Any]]]] = {}
+        # sha256 of an uploaded image -> File handle, mirrored to a sidecar across restarts
+        self._uploaded_files: Dict[str, Any] = {}
+        # sha256 -> templates that have used that upload; only unclaimed uploads are deleted
+        self._upload_owners: Dict[str, Set[str]] = {}
+        # Kept under the cache root, not beside the templates in the source tree
+        self._uploads_sidecar = os.path.join(
+            os.path.expanduser(settings.extraction_cache_dir), "gemini_uploads.json"
+        )
+        # Guards the upload handle map, its owners and the sidecar file
+        self._uploads_lock = threading.Lock()
+        # Guards the template dicts; network calls run under the per-template lock instead
+        self._template_cache_lock = threading.Lock()
+        self._template_locks: Dict[str, threading.Lock] = {}
+        self._template_cache_ttl = settings.template_context_cache_ttl_minutes * 60
         self._preprocess_enabled = bool(settings.enable_image_preprocessing)
         self._preprocess_mode = settings.preprocessing_mode
         self._image_preprocessor = ImagePreprocessor()
+        self.image_max_edge = settings.model_image_max_edge
+        self._image_jpeg_quality = settings.model_image_jpeg_quality
+        # Everything besides image and prompt that changes a page result
+        self._page_cache_version = (
+            f"{self.prompt_version}|preprocess={self._preprocess_enabled}:{self._preprocess_mode}"
+            f"|image={self.image_max_edge}:{self._image_jpeg_quality}"
+        )
         logger.info(
             "AIExtractor initialized | model=%s | preprocessing=%s(%s)",
             self.model_name,
@@ -57,9 +311,12 @@ class AIExtractor:
             self._preprocess_mode,
         )
 
-    def _load_image(self, image_path: str) -> Image.Image:
-        with Image.open(image_path) as raw:
-            image = raw.convert("RGB")
+    def _prepare_image(self, image_path: Union[str, BinaryIO], high_res: bool = False) -> Image.Image:
+        max_edge = MAX_MODEL_IMAGE_DIMENSION if high_res else self.image_max_edge
+        return ImagePreprocessor.open_for_model(image_path, max_edge)
+
+    def _load_image(self, image_path: Union[str, BinaryIO], high_res: bool = False) -> Image.Image:
+        image = self._prepare_image(image_path, high_res)
         if not self._preprocess_enabled:
             return image
         return self._image_preprocessor.preprocess_pil_image(
@@ -67,6 +324,27 @@ class AIExtractor:
             mode=self._preprocess_mode,
         )
 
+    def _image_part(self, image: Image.Image) -> Dict:
+        """Encode a page as a JPEG blob so the SDK uploads it as-is instead of re-encoding losslessly."""
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=self._image_jpeg_quality, optimize=False)
+        return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+
+    def _page_part(self, image_bytes: bytes, high_res: bool = False) -> Dict:
+        """Blob for a page image as sent to Gemini.
+
+        A PNG/JPEG that needs no preprocessing or downscaling is sent as its
+        file bytes (only the header is read); anything else is decoded,
+        prepared and re-encoded via _image_part.
+        """
+        max_edge = MAX_MODEL_IMAGE_DIMENSION if high_res else self.image_max_edge
+        if not self._preprocess_enabled:
+            with Image.open(io.BytesIO(image_bytes)) as header:
+                fmt, size = header.format, header.size
+            if fmt in ("JPEG", "PNG") and max(size) <= max_edge:
+                return {"mime_type": Image.MIME[fmt], "data": image_bytes}
+        return self._image_part(self._load_image(io.BytesIO(image_bytes), high_res))
+
     def _compute_image_hash(self, image_path: str, size: Optional[int] = None) -> str:
         """Compute a lightweight hash of an image for layout similarity checks."""
 
@@ -129,19 +407,13 @@ class AIExtractor:
         try:
             image = self._load_image(image_path)
             logger.info("Analyzing format | path=%s | size=%s | mode=%s", image_path, image.size, image.mode)
-            response = self.model.generate_content([prompt, image])
-            content = response.text.strip()
+            content = _generate_text(self.model, [prompt, self._image_part(image)]).strip()
             logger.debug("Format analysis raw response (%d chars): %s", len(content), content[:500])
 
-            try:
-                fmt = json.loads(content)
-            except json.JSONDecodeError:
-                m = re.search(r"```(?:json)?\s*(.*?)\s*```", content, re.DOTALL)
-                if m:
-                    fmt = json.loads(m.group(1))
-                else:
-                    logger.warning("Format analysis unparseable, using default. Response: %s", content[:300])
-                    return dict(DEFAULT_FORMAT)
+            fmt = _parse_json_response(content)
+            if fmt is None:
+                logger.warning("Format analysis unparseable, using default. Response: %s", content[:300])
+                return dict(DEFAULT_FORMAT)
 
             if "header_fields" not in fmt or not isinstance(fmt["header_fields"], list):
                 logger.warning("Format analysis missing header_fields, using default")
@@ -168,10 +440,7 @@ class AIExtractor:
     @staticmethod
     def build_extraction_prompt(fmt: Dict) -> str:
         """Build a page-level extraction prompt from a format descriptor."""
-        header_json_lines = []
-        for f in fmt.get("header_fields", []):
-            header_json_lines.append(f'  "{f["key"]}": "<{f["label"]}>"')
-        header_json = ",\n".join(header_json_lines)
+        header_json = "".join(f'"{f["key"]}":"<{f["label"]}>",' for f in fmt.get("header_fields", []))
 
         mcq_section = ""
         mcq_example = ""
@@ -183,18 +452,8 @@ class AIExtractor:
                 f"\nMCQ QUESTIONS ({mcq_range}):\n"
                 f"- Answer options are: {', '.join(options)}\n"
                 f"- Return the PRINTED option label letter for the marked choice (e.g. {options[0]})\n"
-                "- A mark can be X/fill/shade/check/tick/dot or a colored box under the option label\n"
-                "- Do not infer by position index alone; use the visible printed option labels\n"
-                '- For a blank/unanswered question use "BL"\n'
-                '- For an invalid answer (two or more bubbles marked) use "IN"\n'
-            )
-            mcq_example = (
-                '  "answers": {\n'
-                f'    "1": "{options[0]}",\n'
-                '    "2": "BL",\n'
-                '    "3": "IN"\n'
-                "  }"
             )
+            mcq_example = f'"answers":{{"1":"{options[0]}","2":"BL","3":"IN"}}'
         elif mcq_range:
             mcq_section = (
                 f"\nSHORT-ANSWER QUESTIONS ({mcq_range}):\n"
@@ -203,9 +462,9 @@ class AIExtractor:
                 "- If writing spills slightly outside the box, still read it for that question.\n"
                 '- If empty, use "BL".\n'
             )
-            mcq_example = '  "answers": {\n    "1": "34",\n    "2": "BL",\n    "3": "41"\n  }'
+            mcq_example = '"answers":{"1":"34","2":"BL","3":"41"}'
         else:
-            mcq_example = '  "answers": {}'
+            mcq_example = '"answers":{}'
 
         drawing_section = ""
         drawing_example = ""
@@ -217,30 +476,15 @@ class AIExtractor:
                 '- If blank, use empty string ""\n'
             )
             start_q = drawing_range.split("-")[0]
-            drawing_example = f'  "drawing_questions": {{\n    "{start_q}": "student written answer"\n  }}'
+            drawing_example = f'"drawing_questions":{{"{start_q}":"student written answer"}}'
         else:
-            drawing_example = '  "drawing_questions": {}'
-
-        header_labels = "\n".join("- " + f["label"] for f in fmt.get("header_fields", []))
+            drawing_example = '"drawing_questions":{}'
 
+        # General rules live in EXTRACTION_SYSTEM_INSTRUCTION; only the sheet schema goes here.
         prompt = (
-            "You are analyzing an exam answer sheet. Extract ALL data with high accuracy.\n\n"
-            "HEADER / METADATA FIELDS (at the top of the page):\n"
-            f"{header_labels}\n"
-            "- Read candidate identifiers carefully (handwriting and boxed digits).\n"
+            "Header fields are at the top of the page.\n"
             f"{mcq_section}{drawing_section}\n"
-            "Return ONLY valid JSON in this exact format:\n"
-            "{\n"
-            f"{header_json},\n"
-            f"{mcq_example},\n"
-            f"{drawing_example}\n"
-            "}\n\n"
-            "IMPORTANT:\n"
-            "- Return ONLY the JSON object, no extra text.\n"
-            '- For every MCQ question in the range, include an entry. Use "BL" if blank.\n'
-            '- Use "IN" for invalid (multiple marks).\n'
-            "- Pay close attention to marked option areas (bubble/box/colored area under option label).\n"
-            "- If a header field is not visible, return an empty string.\n"
+            f"Return JSON: {{{header_json}{mcq_example},{drawing_example}}}\n"
         )
         logger.debug("Built extraction prompt (%d chars)", len(prompt))
         return prompt
@@ -248,70 +492,125 @@ class AIExtractor:
     # ------------------------------------------------------------------
     # 3.  SINGLE-PAGE EXTRACTION
     # ------------------------------------------------------------------
-    def extract_from_image(self, image_path: str, extraction_prompt: Optional[str] = None, use_examples: bool = True) -> Dict:
-        """Extract data from a single exam-sheet image."""
+    def _cached_page_result(self, image_bytes: bytes, prompt: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Return (cache key, cached result) for an image/prompt pair; (None, None) with caching off."""
+        cache = get_extraction_cache()
+        if cache is None:
+            return None, None
+        key = cache.make_page_key(image_bytes, prompt, self.model_name, self._page_cache_version)
+        return key, cache.get_page(key)
+
+    def _store_page_result(self, key: Optional[str], result: Dict) -> None:
+        cache = get_extraction_cache()
+        if cache is None or key is None or not result or "error" in result:
+            return
+        cache.put_page(key, result, {"provider": "gemini", "model": self.model_name, "prompt_version": self._page_cache_version})
+
+    def extract_from_image(self, image_path: str, extraction_prompt: Optional[str] = None, use_examples: bool = True, use_cache: bool = True, high_res: bool = False, feedback: Optional[str] = None) -> Dict:
+        """Extract data from a single exam-sheet image.
+
+        With use_cache, an identical image + prompt seen before is answered
+        from the page cache without calling Gemini. high_res sends the page
+        at up to 3072px instead of MODEL_IMAGE_MAX_EDGE. feedback is an
+        error from an earlier reply for this page (e.g. in a batch), sent
+        with the first request.
+        """
         try:
             if extraction_prompt is None:
-                extraction_prompt = self.build_extraction_prompt(DEFAULT_FORMAT)
+                extraction_prompt = DEFAULT_EXTRACTION_PROMPT
 
-            image = self._load_image(image_path)
-            logger.info("Sending to Gemini: %s (%dx%d)", os.path.basename(image_path), image.size[0], image.size[1])
+            with open(image_path, "rb") as fh:
+                image_bytes = fh.read()
+            cache_key = None
+            if use_cache:
+                cache_key, cached = self._cached_page_result(image_bytes, f"{extraction_prompt}|high_res={high_res}")
+                if cached is not None:
+                    logger.info("Page cache hit: %s", os.path.basename(image_path))
+                    return cached
 
-            response = self.model.generate_content([extraction_prompt, image])
-            content = response.text
-            logger.debug("Gemini response (%d chars): %s", len(content), content[:400])
+            decode_started = time.perf_counter()
+            image_part = self._page_part(image_bytes, high_res)
+            logger.info(
+                "Sending to Gemini: %s (%d KB %s, prepared in %.0f ms)",
+                os.path.basename(image_path), len(image_part["data"]) // 1024, image_part["mime_type"],
+                (time.perf_counter() - decode_started) * 1000,
+            )
 
-            try:
-                result = json.loads(content)
-            except json.JSONDecodeError:
-                m = re.search(r"```(?:json)?\s*(.*?)\s*```", content, re.DOTALL)
-                if m:
-                    result = json.loads(m.group(1))
-                else:
-                    logger.error("JSON parse failed for %s. Raw: %s", os.path.basename(image_path), content[:300])
-                    result = {}
+            prompt = self._feedback_prompt(extraction_prompt, feedback) if feedback else extraction_prompt
+            result: Dict = {}
+            for attempt in range(MAX_FEEDBACK_RETRIES + 1):
+                content = _generate_text(self.extraction_model, [prompt, image_part])
+                logger.debug("Gemini response (%d chars): %s", len(content), content[:400])
+                result, error = self._validate_page_reply(content)
+                if error is None:
+                    break
+                logger.warning("Invalid reply for %s (attempt %d): %s", os.path.basename(image_path), attempt + 1, error)
+                if attempt < MAX_FEEDBACK_RETRIES:
+                    time.sleep(2 ** attempt)
+                    prompt = self._feedback_prompt(extraction_prompt, error)
 
             n_answers = len(result.get("answers", {}))
             n_drawing = len(result.get("drawing_questions", {}))
             header_keys = [k for k in result.keys() if k not in ("answers", "drawing_questions")]
             logger.info("Extracted from %s: %d answers, %d drawing, headers=%s", os.path.basename(image_path), n_answers, n_drawing, header_keys)
+            self._store_page_result(cache_key, result)
             return result
 
         except Exception as e:
             logger.error("Extraction failed for %s: %s: %s", os.path.basename(image_path), type(e).__name__, e)
             return {"error": str(e), "answers": {}, "drawing_questions": {}}
 
+    @staticmethod
+    def _feedback_prompt(extraction_prompt: str, error: str) -> str:
+        return f"{extraction_prompt}\nYour previous output had an error: {error}. Fix it and return only the JSON object.\n"
+
+    @staticmethod
+    def _validate_page_reply(content: str) -> Tuple[Dict, Optional[str]]:
+        """Parse and validate a page reply; returns (result, None) or ({}, error text)."""
+        return AIExtractor._validate_page_data(_parse_json_response(content))
+
+    @staticmethod
+    def _validate_page_data(parsed: Any) -> Tuple[Dict, Optional[str]]:
+        """Validate one parsed page object; returns (result, None) or ({}, error text)."""
+        if not isinstance(parsed, dict):
+            return {}, "the output was not a JSON object"
+        try:
+            _PageExtraction.model_validate(parsed)
+        except ValidationError as e:
+            return {}, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()[:5])
+        return parsed, None
+
+    def _prompt_for_page(self, image_path: str) -> str:
+        """Build this page's extraction prompt, reusing one cached for a similar page."""
+        page_hash = self._compute_image_hash(image_path) if self._use_prompt_cache else None
+        if page_hash is not None:
+            prompt = self._prompt_cache.get(page_hash)
+            if prompt is not None:
+                return prompt
+        fmt = self.analyze_format(image_path)
+        prompt = self.build_extraction_prompt(fmt)
+        if page_hash is not None:
+            self._prompt_cache[page_hash] = prompt
+        return prompt
+
     # ------------------------------------------------------------------
     # 4.  SINGLE-PAGE WITH RETRY
     # ------------------------------------------------------------------
-    def _process_single_page(self, image_path: str, page_num: int, extraction_prompt: Optional[str] = None, max_retries: int = 3) -> Dict:
-        """Process a single page with retry logic."""
+    def _process_single_page(self, image_path: str, page_num: int, extraction_prompt: Optional[str] = None, max_retries: int = 3, feedback: Optional[str] = None) -> Dict:
+        """Process a single page with retry logic; feedback is passed to extract_from_image."""
         for attempt in range(max_retries):
             try:
                 logger.info("Page %d - attempt %d/%d", page_num, attempt + 1, max_retries)
 
                 # If no prompt is provided, analyze this page's format dynamically.
                 if extraction_prompt is None:
-                    fmt = self.analyze_format(image_path)
-                    extraction_prompt = self.build_extraction_prompt(fmt)
-
-                result = self.extract_from_image(image_path, extraction_prompt)
-                result["page_num"] = page_num
-                result["image_path"] = image_path
-
-                # Record how many drawing questions were detected, before normalizing.
-                result["_drawing_count"] = len(result.get("drawing_questions", {}) or {})
-
-                # Normalize drawing questions: mark them as DR instead of trying to interpret.
-                drawing = result.get("drawing_questions", {}) or {}
-                if drawing:
-                    answers = result.setdefault("answers", {})
-                    for q in drawing.keys():
-                        answers[str(q)] = "DR"
-                    result["drawing_questions"] = {}
-
-                n_answers = len(result.get("answers", {}))
-                n_drawing = len(result.get("drawing_questions", {}))
+                    extraction_prompt = self._prompt_for_page(image_path)
+
+                result = self.extract_from_image(image_path, extraction_prompt, feedback=feedback)
+                self._normalize_page_result(result, page_num, image_path)
+
+                n_answers = len(result["answers"])
+                n_drawing = result["_drawing_count"]
                 has_error = "error" in result
 
                 if has_error:
@@ -330,25 +629,152 @@ class AIExtractor:
                     time.sleep(wait_time)
                 else:
                     logger.error("All %d attempts failed for page %d: %s", max_retries, page_num, e)
-                    return {"page_num": page_num, "error": str(e), "answers": {}, "drawing_questions": {}}
+                    return self._normalize_page_result({"error": str(e)}, page_num, image_path)
+
+        return self._normalize_page_result({"error": "Max retries exhausted"}, page_num, image_path)
 
-        return {"page_num": page_num, "error": "Max retries exhausted", "answers": {}, "drawing_questions": {}}
+    @staticmethod
+    def _normalize_page_result(result: Dict, page_num: int, image_path: str) -> Dict:
+        """Give every page result the same shape so callers index keys directly."""
+        result["page_num"] = page_num
+        result["image_path"] = image_path
+        answers = result.get("answers")
+        if not isinstance(answers, dict):
+            answers = result["answers"] = {}
+
+        # Record how many drawing questions were detected, then normalize them:
+        # mark them as DR instead of trying to interpret.
+        drawing = result.get("drawing_questions") or {}
+        result["_drawing_count"] = len(drawing)
+        if drawing:
+            answers.update(dict.fromkeys(map(str, drawing), "DR"))
+        result["drawing_questions"] = {}
+
+        # Models name the candidate field inconsistently; resolve it once here.
+        candidate_number = result.get("candidate_number") or result.get("candidate_id") or result.get("id")
+        paper_type = result.get("paper_type") or result.get("paper")
+        result["candidate_number"] = str(candidate_number) if candidate_number is not None else ""
+        result["paper_type"] = str(paper_type) if paper_type is not None else ""
+        return result
+
+    # ------------------------------------------------------------------
+    # 4b. BATCHED PAGES (several sheets per call)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _batch_prompt(extraction_prompt: str, count: int) -> str:
+        return (
+            f"{extraction_prompt}\n\n"
+            f"BATCH MODE: {count} answer sheets follow, one image each, in order.\n"
+            f"Return ONLY a JSON array with exactly {count} objects, one per image in the same order. "
+            f'Each object has the format above plus a "page" field with its image index (1..{count}).\n'
+        )
+
+    def _process_page_batch(self, pages: List[Tuple[int, str]], extraction_prompt: Optional[str] = None) -> List[Tuple[int, Dict]]:
+        """Extract several pages that share one prompt in a single Gemini call.
+
+        Pages already in the page cache are answered from it; the rest are
+        sent together and each reply item is validated like a single-page
+        reply, then cached. Pages whose prompt differs from the first page's,
+        pages missing from the batched reply and pages whose item fails
+        validation go through the per-page path (the latter with the
+        validation error as feedback).
+        """
+        if len(pages) == 1:
+            page_num, image_path = pages[0]
+            return [(page_num, self._process_single_page(image_path, page_num, extraction_prompt))]
+
+        batch: List[Tuple[int, str]] = []
+        # (page_num, image_path, prompt, feedback) for the per-page path
+        leftover: List[Tuple[int, str, Optional[str], Optional[str]]] = []
+        batch_prompt: Optional[str] = extraction_prompt
+        for page_num, image_path in pages:
+            page_prompt = extraction_prompt or self._prompt_for_page(image_path)
+            if batch_prompt is None:
+                batch_prompt = page_prompt
+            if page_prompt == batch_prompt:
+                batch.append((page_num, image_path))
+            else:
+                leftover.append((page_num, image_path, extraction_prompt, None))
+
+        # Same key as extract_from_image, so batched and per-page runs share entries
+        cache_prompt = f"{batch_prompt}|high_res=False"
+        results: List[Tuple[int, Dict]] = []
+        pending: List[Tuple[int, str, bytes, Optional[str]]] = []
+        for page_num, image_path in batch:
+            with open(image_path, "rb") as fh:
+                image_bytes = fh.read()
+            cache_key, cached = self._cached_page_result(image_bytes, cache_prompt)
+            if cached is not None:
+                logger.info("Page cache hit: %s", os.path.basename(image_path))
+                results.append((page_num, self._normalize_page_result(cached, page_num, image_path)))
+            else:
+                pending.append((page_num, image_path, image_bytes, cache_key))
+
+        if len(pending) == 1:
+            page_num, image_path, _, _ = pending[0]
+            leftover.append((page_num, image_path, batch_prompt, None))
+        elif pending:
+            page_nums = [p for p, _, _, _ in pending]
+            by_index: Dict[int, Any] = {}
+            try:
+                decode_started = time.perf_counter()
+                images = [self._page_part(image_bytes) for _, _, image_bytes, _ in pending]
+                call_started = time.perf_counter()
+                logger.info("Sending batch of %d pages to Gemini: %s", len(pending), page_nums)
+                content = _generate_text(self.extraction_model, [self._batch_prompt(batch_prompt, len(pending))] + images)
+                # Decode runs on the worker ahead of the call; if its share grows, prefetching pays off.
+                logger.info(
+                    "Batch %s timing: decode %.0f ms, model %.0f ms",
+                    page_nums,
+                    (call_started - decode_started) * 1000,
+                    (time.perf_counter() - call_started) * 1000,
+                )
+                parsed = _parse_json_response(content, f"batch {page_nums}")
+                if isinstance(parsed, dict):
+                    parsed = parsed.get("pages") or parsed.get("results")
+                for item in parsed if isinstance(parsed, list) else []:
+                    try:
+                        index = int(item.pop("page"))
+                    except (AttributeError, KeyError, TypeError, ValueError):
+                        continue
+                    if 1 <= index <= len(pending):
+                        by_index[index] = item
+            except Exception as e:
+                logger.warning("Batch %s failed (%s: %s); retrying pages individually", page_nums, type(e).__name__, e)
+
+            for index, (page_num, image_path, _, cache_key) in enumerate(pending, start=1):
+                if index not in by_index:
+                    leftover.append((page_num, image_path, batch_prompt, None))
+                    continue
+                result, error = self._validate_page_data(by_index[index])
+                if error is not None:
+                    logger.warning("Invalid batch item for page %d: %s", page_num, error)
+                    leftover.append((page_num, image_path, batch_prompt, error))
+                    continue
+                self._store_page_result(cache_key, result)
+                results.append((page_num, self._normalize_page_result(result, page_num, image_path)))
+
+        if leftover:
+            logger.info("Falling back to per-page extraction for pages %s", [p for p, _, _, _ in leftover])
+        for page_num, image_path, prompt, feedback in leftover:
+            results.append((page_num, self._process_single_page(image_path, page_num, prompt, feedback=feedback)))
+        return results
 
     # ------------------------------------------------------------------
     # 5.  MULTI-PAGE EXTRACTION
     # ------------------------------------------------------------------
     def extract_from_multiple_images(self, image_paths: List[str], extraction_prompt: Optional[str] = None, submission_id: Optional[int] = None, db=None, use_parallel: bool = True, max_workers: int = 4) -> Dict:
         """Extract data from multiple exam-sheet images with dynamic format detection."""
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-
-        candidates: List[Dict] = []
+        # One slot per page: results land out of order but come out in page order without a sort
+        page_slots: List[Optional[Dict]] = [None] * len(image_paths)
         errors: List[str] = []
         detected_format: Optional[Dict] = None
         start_time = time.time()
         total_pages = len(image_paths)
         completed_pages = 0
+        pending_logs: List[ProcessingLog] = []
 
-        logger.info("Starting extraction: %d pages, parallel=%s, workers=%d", len(image_paths), use_parallel, max_workers)
+        logger.info("Starting extraction: %d pages, parallel=%s, workers=%d, batch=%d", len(image_paths), use_parallel, max_workers, self.batch_size)
 
         def _handle_result(result: Dict, page_num: int):
             nonlocal completed_pages
@@ -356,89 +782,82 @@ class AIExtractor:
             if "error" in result:
                 errors.append(f"Page {page_num}: {result['error']}")
 
-            # Keep output minimal and consistent across pages regardless of format.
-            candidate_number = (
-                result.get("candidate_number")
-                or result.get("candidate_id")
-                or result.get("id")
-                or ""
-            )
-            paper_type = result.get("paper_type") or result.get("paper") or ""
-
-            candidate: Dict = {
+            # Keep output minimal and consistent across pages regardless of format;
+            # _normalize_page_result guarantees these keys.
+            answers = result["answers"]
+            page_slots[page_num - 1] = {
                 "page_number": page_num,
-                "candidate_number": str(candidate_number) if candidate_number is not None else "",
-                "paper_type": str(paper_type) if paper_type is not None else "",
-                "answers": result.get("answers", {}),
+                "candidate_number": result["candidate_number"],
+                "paper_type": result["paper_type"],
+                "answers": answers,
             }
-            candidates.append(candidate)
 
             if db is not None and submission_id is not None:
-                from backend.db.models import ProcessingLog
-                label = str(result.get("candidate_number") or result.get("candidate_id") or "")
-                n_ans = len(result.get("answers", {}))
-                n_draw = int(result.get("_drawing_count", 0))
+                label = result["candidate_number"]
+                n_ans = len(answers)
+                n_draw = result["_drawing_count"]
                 progress = completed_pages / max(total_pages, 1)
-                try:
-                    db.add(ProcessingLog(
-                        submission_id=submission_id,
-                        action="page_progress",
-                        status="info",
-                        message=f"Page {page_num}: {n_ans} answers, {n_draw} drawing ({completed_pages}/{total_pages})",
-                        extra_data={
-                            "page": page_num,
-                            "current": completed_pages,
-                            "total": total_pages,
-                            "progress": round(progress, 4),
-                            "label": label,
-                            "answers_count": n_ans,
-                            "drawing_count": n_draw,
-                        },
-                    ))
-                    db.commit()
-                except Exception as log_error:
-                    db.rollback()
-                    logger.warning("Failed to persist page_progress log for page %s: %s", page_num, log_error)
-
-        # Step 2: Extract pages
+                pending_logs.append(ProcessingLog(
+                    submission_id=submission_id,
+                    action="page_progress",
+                    status="info",
+                    message=f"Page {page_num}: {n_ans} answers, {n_draw} drawing ({completed_pages}/{total_pages})",
+                    extra_data={
+                        "page": page_num,
+                        "current": completed_pages,
+                        "total": total_pages,
+                        "progress": round(progress, 4),
+                        "label": label,
+                        "answers_count": n_ans,
+                        "drawing_count": n_draw,
+                    },
+                ))
+
+        def _flush_progress():
+            # One commit per finished batch keeps live progress without a commit per page.
+            if not pending_logs:
+                return
+            try:
+                db.add_all(pending_logs)
+                db.commit()
+            except Exception as log_error:
+                db.rollback()
+                logger.warning("Failed to persist %d page_progress logs: %s", len(pending_logs), log_error)
+            pending_logs.clear()
+
+        # Step 2: Extract pages, batch_size sheets per Gemini call
         logger.info("Step 2: Extracting %d pages ...", len(image_paths))
-        if use_parallel and len(image_paths) > 1:
-            effective_workers = max_workers
-            if len(image_paths) > 20:
-                effective_workers = min(max_workers, 2)
-            logger.info("Parallel mode: %d pages, %d workers", len(image_paths), effective_workers)
+        numbered = list(enumerate(image_paths, start=1))
+        batches = [numbered[i:i + self.batch_size] for i in range(0, len(numbered), self.batch_size)]
+        if use_parallel and len(batches) > 1:
+            # Calls are network-bound; MAX_EXTRACTION_WORKERS bounds concurrency for rate limits
+            effective_workers = max(1, min(max_workers, len(batches)))
+            logger.info("Parallel mode: %d pages in %d batches, %d workers", len(image_paths), len(batches), effective_workers)
 
             with ThreadPoolExecutor(max_workers=effective_workers) as executor:
-                future_to_page = {
-                    executor.submit(self._process_single_page, img, i, extraction_prompt): i
-                    for i, img in enumerate(image_paths, start=1)
+                future_to_batch = {
+                    executor.submit(self._process_page_batch, batch, extraction_prompt): batch
+                    for batch in batches
                 }
-                for future in as_completed(future_to_page):
-                    page_num = future_to_page[future]
+                for future in as_completed(future_to_batch):
+                    batch = future_to_batch[future]
                     try:
-                        _handle_result(future.result(), page_num)
+                        for page_num, result in future.result():
+                            _handle_result(result, page_num)
                     except Exception as e:
-                        logger.error("Future error page %d: %s: %s", page_num, type(e).__name__, e)
-                        errors.append(f"Page {page_num}: {e}")
+                        logger.error("Future error pages %s: %s: %s", [p for p, _ in batch], type(e).__name__, e)
+                        errors.extend(f"Page {p}: {e}" for p, _ in batch)
+                    _flush_progress()
         else:
-            logger.info("Sequential mode: %d pages", len(image_paths))
-            for i, img in enumerate(image_paths, start=1):
-                # Use a cached prompt when possible so similar pages don't re-run format analysis.
-                prompt = extraction_prompt
-                if prompt is None:
-                    page_hash = self._compute_image_hash(img)
-                    prompt = self._prompt_cache.get(page_hash)
-                    if prompt is None:
-                        fmt = self.analyze_format(img)
-                        prompt = self.build_extraction_prompt(fmt)
-                        self._prompt_cache[page_hash] = prompt
-
-                result = self._process_single_page(img, i, prompt)
-                _handle_result(result, i)
+            logger.info("Sequential mode: %d pages in %d batches", len(image_paths), len(batches))
+            for batch in batches:
+                for page_num, result in self._process_page_batch(batch, extraction_prompt):
+                    _handle_result(result, page_num)
+                _flush_progress()
 
         # Step 3: Aggregate
         elapsed_time = time.time() - start_time
-        candidates.sort(key=lambda x: x.get("page_number", 0))
+        candidates = [c for c in page_slots if c is not None]
         pages_with_data = sum(1 for c in candidates if c.get("answers"))
 
         logger.info(
@@ -469,8 +888,11 @@ class AIExtractor:
         """Validate extracted data for common issues."""
         warnings: List[str] = []
         candidates = extraction_result.get("candidates", [])
-        fmt = extraction_result.get("detected_format", DEFAULT_FORMAT)
-        valid_answers = set(fmt.get("answer_options", ["A", "B", "C", "D", "E"])) | {"BL", "IN"}
+        fmt = extraction_result.get("detected_format")
+        if fmt is None:
+            valid_answers = _DEFAULT_VALID_ANSWERS
+        else:
+            valid_answers = frozenset(fmt.get("answer_options", DEFAULT_FORMAT["answer_options"])) | _VALID_MARKS
 
         total_answers = 0
         total_drawing = 0
@@ -495,25 +917,347 @@ class AIExtractor:
             "total_drawing_questions": total_drawing,
         }
 
+    # ------------------------------------------------------------------
+    # 7.  TEMPLATES (FEW-SHOT EXAMPLES)
+    # ------------------------------------------------------------------
+    def clear_template_cache(self) -> None:
+        """Forget decoded examples, upload handles and context caches so templates reload on next use.
+
+        Edits are normally picked up through the directory's mtime signature;
+        this covers changes that keep mtimes (e.g. files restored from backup).
+        """
+        _load_template_examples.cache_clear()
+        with self._template_cache_lock:
+            self._template_files.clear()
+            entries = list(self._template_cache.values())
+            self._template_cache.clear()
+        # Only the context caches go; uploaded files may back other templates and expire on their own.
+        for entry in entries:
+            self._delete_cached_content(entry[3])
+        logger.info("Template caches cleared")
+
+    def _template_lock(self, template_name: str) -> threading.Lock:
+        """Lock serializing uploads and context-cache creation for one template."""
+        with self._template_cache_lock:
+            return self._template_locks.setdefault(template_name, threading.Lock())
+
+    def create_template(self, image_path: str, expected_output: Dict, template_name: str = "default", pretty: bool = False) -> Dict:
+        """Store an example image and its correct output as the next example of a template.
+
+        The JSON is written compact unless pretty=True (for hand-edited templates).
+        """
+        template_path = os.path.join(self.template_dir, template_name)
+        os.makedirs(template_path, exist_ok=True)
+
+        # The image is created exclusively, so concurrent calls never share a number;
+        # the JSON lands last via os.replace, so readers never see a partial example.
+        example_number = max(_example_numbers(template_path), default=0) + 1
+        while True:
+            example_image = os.path.join(template_path, f"example_{example_number}.png")
+            try:
+                self._claim_example_image(image_path, example_image)
+                break
+            except FileExistsError:
+                example_number += 1
+
+        example_json = os.path.join(template_path, f"example_{example_number}.json")
+        tmp_json = os.path.join(template_path, f".example_{example_number}.json.tmp")
+        with open(tmp_json, "wb", buffering=65536) as fh:
+            fh.write(_json_dumps(expected_output, pretty=pretty))
+        os.replace(tmp_json, example_json)
+
+        logger.info("Created template example %s/example_%d", template_name, example_number)
+        return {
+            "template": template_name,
+            "example_number": example_number,
+            "image_path": example_image,
+            "json_path": example_json,
+        }
+
+    @staticmethod
+    def _claim_example_image(image_path: str, example_image: str) -> None:
+        """Create example_image from image_path; raises FileExistsError if it is taken."""
+        if image_path.lower().endswith(".png"):
+            # Hardlink on the same filesystem; a plain byte copy otherwise.
+            try:
+                os.link(image_path, example_image)
+                return
+            except FileExistsError:
+                raise
+            except OSError:
+                pass
+            with open(image_path, "rb") as src, open(example_image, "xb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            with Image.open(image_path) as raw, open(example_image, "xb") as dst:
+                raw.convert("RGB").save(dst, format="PNG")
+
+    @staticmethod
+    def _template_preamble(examples, files: Optional[List[Any]] = None) -> List[Any]:
+        """Few-shot parts for a template; uploaded File handles replace the decoded images when given."""
+        parts: List[Any] = [
+            "You are extracting answers from exam sheets. "
+            "Here are examples of sheets and their correct JSON output:\n"
+        ]
+        for i, (_, example_image, expected) in enumerate(examples):
+            parts.append(f"\nExample {i + 1}:")
+            parts.append(files[i] if files else example_image)
+            parts.append(f"Expected output:\n{expected}")
+        return parts
+
+    @staticmethod
+    def _file_expiry(file) -> datetime:
+        # Uploaded files live ~48h; treat them as stale shortly before they lapse.
+        expires = getattr(file, "expiration_time", None) or datetime.now(timezone.utc) + timedelta(hours=47)
+        return expires - timedelta(minutes=10)
+
+    def _read_uploads_sidecar(self) -> Dict[str, str]:
+        try:
+            with open(self._uploads_sidecar, "rb") as fh:
+                return _json_loads(fh.read())
+        except (OSError, ValueError):
+            return {}
+
+    def _write_uploads_sidecar(self, names: Dict[str, str]) -> None:
+        tmp_path = f"{self._uploads_sidecar}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self._uploads_sidecar), exist_ok=True)
+            with open(tmp_path, "wb") as fh:
+                fh.write(_json_dumps(names))
+            os.replace(tmp_path, self._uploads_sidecar)
+        except OSError as e:
+            logger.warning("Could not write upload sidecar %s: %s", self._uploads_sidecar, e)
+
+    def _update_uploads_sidecar(self, digest: str, name: str) -> None:
+        """Record the upload for a digest in the sidecar."""
+        with self._uploads_lock:
+            names = self._read_uploads_sidecar()
+            names[digest] = name
+            self._write_uploads_sidecar(names)
+
+    def _get_or_upload(self, path: str, owner: str, mime_type: str = "image/png", uploaded_now: Optional[List[Tuple[str, Any]]] = None) -> Any:
+        """Return a live File handle for path's content, uploading only unseen or expired content.
+
+        Handles are keyed by the file's SHA-256, so identical images share one
+        upload. The sha -> file name map is persisted in the cache directory and
+        re-resolved with get_file after a restart. owner (a template name) is
+        recorded against the digest; new uploads are appended to uploaded_now
+        as (digest, file) so a caller can undo them.
+        """
+        digest = hash_file(path)
+        now = datetime.now(timezone.utc)
+
+        with self._uploads_lock:
+            self._upload_owners.setdefault(digest, set()).add(owner)
+            cached = self._uploaded_files.get(digest)
+            if cached is not None and self._file_expiry(cached) > now:
+                return cached
+            name = None if cached is not None else self._read_uploads_sidecar().get(digest)
+        if name:
+            try:
+                remote = genai.get_file(name)
+                if getattr(getattr(remote, "state", None), "name", "ACTIVE") == "ACTIVE" and self._file_expiry(remote) > now:
+                    with self._uploads_lock:
+                        self._uploaded_files[digest] = remote
+                    return remote
+            except Exception as e:
+                logger.info("Stored upload for %s is gone (%s); uploading again", os.path.basename(path), e)
+
+        uploaded = genai.upload_file(path, mime_type=mime_type)
+        if uploaded_now is not None:
+            uploaded_now.append((digest, uploaded))
+        with self._uploads_lock:
+            self._uploaded_files[digest] = uploaded
+        self._update_uploads_sidecar(digest, uploaded.name)
+        return uploaded
+
+    def _discard_uploads(self, owner: str, uploads: List[Tuple[str, Any]]) -> None:
+        """Delete files an example set uploaded before failing, unless another template uses them."""
+        for digest, uploaded in uploads:
+            with self._uploads_lock:
+                owners = self._upload_owners.get(digest, set())
+                owners.discard(owner)
+                if owners:
+                    continue
+                self._upload_owners.pop(digest, None)
+                if self._uploaded_files.get(digest) is uploaded:
+                    del self._uploaded_files[digest]
+                # A newer upload of the same content may have replaced this entry
+                names = self._read_uploads_sidecar()
+                if names.get(digest) == uploaded.name:
+                    del names[digest]
+                    self._write_uploads_sidecar(names)
+            try:
+                genai.delete_file(uploaded.name)
+            except Exception as e:
+                logger.info("Could not delete upload %s: %s", uploaded.name, e)
+
+    def _template_example_files(self, template_name: str, signature: int, examples) -> Optional[List[Any]]:
+        """File handles for a template's example images, reused until the first one nears expiry.
+
+        Returns None when an upload fails; callers then send the decoded
+        images inline. A failure is retried after a few minutes.
+        """
+        entry = self._template_files.get(template_name)
+        if entry and entry[0] == signature and entry[1] > datetime.now(timezone.utc):
+            return entry[2]
+
+        # Uploads block only calls for this template; re-check once the lock is held.
+        with self._template_lock(template_name):
+            now = datetime.now(timezone.utc)
+            entry = self._template_files.get(template_name)
+            if entry and entry[0] == signature and entry[1] > now:
+                return entry[2]
+
+            uploaded_now: List[Tuple[str, Any]] = []
+            try:
+                files = [
+                    self._get_or_upload(path, template_name, uploaded_now=uploaded_now)
+                    for path, _, _ in examples
+                ]
+            except Exception as e:
+                logger.warning("Could not upload examples for template '%s': %s", template_name, e)
+                self._discard_uploads(template_name, uploaded_now)
+                files = None
+                expires = now + timedelta(minutes=5)
+            else:
+                expires = min(self._file_expiry(f) for f in files)
+                logger.info("Using %d uploaded example images for template '%s'", len(files), template_name)
+
+            with self._template_cache_lock:
+                self._template_files[template_name] = (signature, expires, files)
+            return files
+
+    def _cached_template_model(self, template_name: str, signature: int, preamble: List[Any]) -> Optional[Any]:
+        """Model bound to a provider-side context cache of the template preamble.
+
+        The cache is created once per template (and again when the examples
+        change or the TTL lapses). Returns None when caching is disabled or the
+        provider rejects it (e.g. preamble below the minimum cacheable size);
+        a rejection is remembered until expiry so it is not retried per call.
+        """
+        if self._template_cache_ttl <= 0:
+            return None
+        entry = self._template_cache.get(template_name)
+        if entry and entry[0] == signature and entry[1] > time.monotonic():
+            return entry[2]
+
+        # Only calls for this template wait on the create; re-check once the lock is held.
+        with self._template_lock(template_name):
+            entry = self._template_cache.get(template_name)
+            if entry and entry[0] == signature and entry[1] > time.monotonic():
+                return entry[2]
+
+            model = None
+            cached = None
+            try:
+                cached = genai_caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=f"template-{template_name}",
+                    contents=[{"role": "user", "parts": preamble}],
+                    ttl=timedelta(seconds=self._template_cache_ttl),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached)
+                logger.info("Created context cache for template '%s'", template_name)
+            except Exception as e:
+                logger.warning("Context caching unavailable for template '%s': %s", template_name, e)
+
+            # Refresh a minute early so a call never references an expired cache.
+            expires = time.monotonic() + max(self._template_cache_ttl - 60, 0)
+            with self._template_cache_lock:
+                self._template_cache[template_name] = (signature, expires, model, cached)
+        if entry is not None:
+            # The replaced cache would otherwise bill storage until its TTL runs out;
+            # the files it referenced are kept for the templates still using them.
+            self._delete_cached_content(entry[3])
+        return model
+
+    @staticmethod
+    def _delete_cached_content(cached: Any) -> None:
+        if cached is None:
+            return
+        try:
+            cached.delete()
+        except Exception as e:
+            logger.info("Could not delete context cache %s: %s", getattr(cached, "name", "?"), e)
+
+    def extract_with_template(self, image_path: str, template_name: str = "default", use_cache: bool = True) -> Dict:
+        """Extract data from an image using a template's stored examples as few-shot context."""
+        template_path = os.path.join(self.template_dir, template_name)
+        signature = _template_signature(template_path)
+        examples = _load_template_examples(template_path, signature)
+        if not examples:
+            logger.warning("Template '%s' has no examples; using standard extraction", template_name)
+            return self.extract_from_image(image_path, use_cache=use_cache)
+
+        try:
+            with open(image_path, "rb") as fh:
+                image_bytes = fh.read()
+            cache_key = None
+            if use_cache:
+                # The examples are part of the prompt: key on the template's current signature.
+                cache_key, cached = self._cached_page_result(image_bytes, f"template:{template_name}:{signature}")
+                if cached is not None:
+                    logger.info("Page cache hit: %s (template %s)", os.path.basename(image_path), template_name)
+                    return cached
+
+            request_parts = [
+                "\nNow extract the data from this sheet. Return ONLY a JSON object "
+                "in exactly the same format as the examples, no extra text.",
+                self._image_part(self._load_image(io.BytesIO(image_bytes))),
+            ]
+            files = self._template_example_files(template_name, signature, examples)
+            preamble = self._template_preamble(examples, files)
+            cached_model = self._cached_template_model(template_name, signature, preamble)
+            if cached_model is not None:
+                content = _generate_text(cached_model, request_parts)
+            else:
+                content = _generate_text(self.model, preamble + request_parts)
+
+            result = _parse_json_response(content, f"{os.path.basename(image_path)} (template {template_name})")
+            if result is None:
+                result = {}
+
+            logger.info("Extracted %s with template '%s' (%d examples)", os.path.basename(image_path), template_name, len(examples))
+            self._store_page_result(cache_key, result)
+            return result
+
+        except Exception as e:
+            logger.error("Template extraction failed for %s: %s: %s", os.path.basename(image_path), type(e).__name__, e)
+            return {"error": str(e)}
+
+
+# Prompt for pages extracted without format analysis; built once at import.
+DEFAULT_EXTRACTION_PROMPT = AIExtractor.build_extraction_prompt(DEFAULT_FORMAT)
+
+
+_ai_extractor = None
+
 
 def get_ai_extractor():
-    """Factory function to create extractor instance.
+    """Get or create the shared extractor instance.
 
     Returns OptimizedAIExtractor if use_optimized_pipeline=True in config,
-    otherwise returns legacy AIExtractor.
+    otherwise returns legacy AIExtractor. The instance (model handle and
+    format/prompt caches) is reused across requests.
     """
+    global _ai_extractor
+    if _ai_extractor is not None:
+        return _ai_extractor
+
     settings = get_settings()
 
     if settings.use_optimized_pipeline:
         try:
             from backend.services.optimized_extractor import OptimizedAIExtractor
             logger.info("Using OPTIMIZED pipeline (CV preprocessing + token optimization)")
-            return OptimizedAIExtractor(
+            _ai_extractor = OptimizedAIExtractor(
                 max_workers=settings.max_extraction_workers
             )
         except ImportError as e:
-            logger.warning(f"Failed to import OptimizedAIExtractor, falling back to legacy: {e}")
-            return AIExtractor()
+            logger.warning("Failed to import OptimizedAIExtractor, falling back to legacy: %s", e)
+            _ai_extractor = AIExtractor()
     else:
         logger.info("Using LEGACY pipeline")
-        return AIExtractor()
+        _ai_extractor = AIExtractor()
+    return _ai_extractor
@@ -0,0 +1,178 @@
+"""
+Content-addressable cache for extraction results.
+
+Entries are keyed on the SHA-256 of the source PDF plus everything that can
+change the model's output (provider, model, prompt version, pipeline), so an
+identical re-upload skips rasterization and every LLM call. Single-page
+results are cached the same way, keyed on the image bytes and the prompt.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class _CachedExtractionResult(BaseModel):
+    candidates: List[Dict[str, Any]]
+    pages_processed: int = 0
+    pages_with_data: int = 0
+
+
+class _CacheEntry(BaseModel):
+    key: str
+    created_at: str
+    config: Dict[str, Any]
+    extraction_result: Dict[str, Any]
+    validation_result: Dict[str, Any]
+
+
+class _PageCacheEntry(BaseModel):
+    key: str
+    created_at: str
+    config: Dict[str, Any]
+    result: Dict[str, Any]
+
+
+def hash_fileobj(file_obj: BinaryIO) -> str:
+    """Return the SHA-256 hex digest of a binary file object from its current position."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 hex digest of a file on disk."""
+    with open(path, "rb") as fh:
+        return hash_fileobj(fh)
+
+
+class ExtractionCache:
+    """JSON-file cache of extraction + validation results under a cache directory."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir).expanduser().resolve()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        logger.info("Initialized ExtractionCache at %s", self.cache_dir)
+
+    @staticmethod
+    def make_key(pdf_sha256: str, provider: str, model: str, prompt_version: str, pipeline: str = "") -> str:
+        """Build the cache key from the PDF digest and the extraction configuration."""
+        raw = json.dumps([provider, model, prompt_version, pipeline, pdf_sha256])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_page_key(image_bytes: bytes, prompt: str, model: str, prompt_version: str) -> str:
+        """Build a page-result key from the image bytes and everything sent with them.
+
+        The image and prompt are length-prefixed so no two (image, prompt)
+        pairs hash the same byte stream.
+        """
+        digest = hashlib.sha256()
+        prompt_bytes = prompt.encode("utf-8")
+        for part in (image_bytes, prompt_bytes, model.encode("utf-8"), prompt_version.encode("utf-8")):
+            digest.update(struct.pack(">Q", len(part)))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _page_path_for(self, key: str) -> Path:
+        return self.cache_dir / "pages" / key[:2] / f"{key}.json"
+
+    def _write(self, path: Path, data: bytes, key: str) -> None:
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Failed to write extraction cache entry %s: %s", key, exc)
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, or None on miss or invalid entry."""
+        path = self._path_for(key)
+        if not path.exists():
+            return None
+        try:
+            entry = _CacheEntry.model_validate_json(path.read_bytes())
+            _CachedExtractionResult.model_validate(entry.extraction_result)
+        except (OSError, ValidationError) as exc:
+            logger.warning("Discarding invalid cache entry %s: %s", key, exc)
+            path.unlink(missing_ok=True)
+            return None
+        logger.info("Extraction cache hit: %s", key)
+        return entry.model_dump()
+
+    def put(
+        self,
+        key: str,
+        extraction_result: Dict[str, Any],
+        validation_result: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Store an entry atomically; failures are logged and ignored."""
+        entry = _CacheEntry(
+            key=key,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            config=config or {},
+            extraction_result=extraction_result,
+            validation_result=validation_result,
+        )
+        self._write(self._path_for(key), entry.model_dump_json().encode("utf-8"), key)
+
+    def get_page(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached single-page result for key, or None on miss or invalid entry."""
+        path = self._page_path_for(key)
+        if not path.exists():
+            return None
+        try:
+            entry = _PageCacheEntry.model_validate_json(path.read_bytes())
+        except (OSError, ValidationError) as exc:
+            logger.warning("Discarding invalid page cache entry %s: %s", key, exc)
+            path.unlink(missing_ok=True)
+            return None
+        logger.debug("Page cache hit: %s", key)
+        return entry.result
+
+    def put_page(self, key: str, result: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> None:
+        """Store a single-page result atomically; failures are logged and ignored."""
+        entry = _PageCacheEntry(
+            key=key,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            config=config or {},
+            result=result,
+        )
+        self._write(self._page_path_for(key), entry.model_dump_json().encode("utf-8"), key)
+
+
+_extraction_cache: Optional[ExtractionCache] = None
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Return the shared cache, or None when caching is disabled."""
+    global _extraction_cache
+    settings = get_settings()
+    if not settings.extraction_cache_enabled:
+        return None
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache(settings.extraction_cache_dir)
+    return _extraction_cache
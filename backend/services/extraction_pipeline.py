@@ -20,12 +20,35 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import lru_cache
 
 from backend.services.page_analyzer import (
-    PageLayout, RegionType, DetectedRegion, QuestionType, PageAnalyzer
+    PageLayout, RegionType, DetectedRegion, QuestionType, PageAnalyzer, LayoutClusterer
 )
 from backend.services.gemini_client import create_gemini_model
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Bump whenever a prompt below changes so cached extractions are invalidated.
+PROMPT_VERSION = "pipeline-2"
+
+# Markdown code fence around JSON somewhere inside a model reply
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.IGNORECASE | re.DOTALL)
+
+
+def _json_loads(text: str) -> Any:
+    """json.loads via orjson when installed; both raise json.JSONDecodeError subclasses."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _strip_fence(text: str) -> str:
+    """Slice a single wrapping ```json fence off an already-stripped reply."""
+    return text.removeprefix("```json").removeprefix("```JSON").removeprefix("```").removesuffix("```").strip()
+
 
 # =============================================================================
 # DATA STRUCTURES
@@ -136,10 +159,10 @@ Return ONLY valid JSON."""
         cache_key = layout.layout_hash
 
         if not force_refresh and cache_key in self.cache:
-            logger.info(f"Format cache hit for layout {cache_key}")
+            logger.info("Format cache hit for layout %s", cache_key)
             return self.cache[cache_key]
 
-        logger.info(f"Detecting format for layout {cache_key} (LLM call)")
+        logger.info("Detecting format for layout %s (LLM call)", cache_key)
 
         try:
             response = self.model.generate_content(
@@ -155,7 +178,7 @@ Return ONLY valid JSON."""
             return result
 
         except Exception as e:
-            logger.error(f"Format detection failed: {e}")
+            logger.error("Format detection failed: %s", e)
             return self._create_fallback_format(layout.layout_hash)
 
     def _parse_format_response(self, response_text: str, format_id: str) -> ExamFormat:
@@ -163,10 +186,9 @@ Return ONLY valid JSON."""
         # Clean response
         text = response_text.strip()
         if text.startswith("```"):
-            text = re.sub(r"```json?\s*", "", text)
-            text = re.sub(r"```\s*$", "", text)
+            text = _strip_fence(text)
 
-        data = json.loads(text)
+        data = _json_loads(text)
 
         # Parse question ranges
         question_ranges = {}
@@ -429,6 +451,45 @@ Only use "DR" for actual pictures/sketches that cannot be typed.
 
 Return ONLY the JSON object."""
 
+    # Static instruction blocks come first in their prompts so every page
+    # shares the same prefix; the sheet-specific part is appended after.
+    MCQ_FOCUSED_RULES = """Students mark by X/fill/shade/check, or by coloring a box under the chosen option.
+
+HOW TO READ EACH ROW:
+1. Find the question number on the left
+2. Look across the row at each option area
+3. Identify which ONE option area has a clear deliberate mark
+4. Return the PRINTED LETTER LABEL of that marked option
+
+IMPORTANT DISTINCTIONS:
+- A MARKED option area: has visible X/fill/shading/check/tick/dot or colored box under label
+- An UNMARKED option area: empty/clear/pristine with no deliberate mark
+- Each question has exactly ONE answer - find the ONE marked option
+- If truly no option is marked, return "BL"
+- If more than one option is clearly marked, return "IN"
+
+Return ONLY the JSON object, with question numbers as keys."""
+
+    FULL_EXTRACTION_RULES = """Extract all data from this exam answer sheet image.
+
+CRITICAL RULES:
+1. MCQ: Look for marked option areas (bubble/box/colored area under option) and return the PRINTED letter label
+2. FREE RESPONSE: Numbers/text WRITTEN in boxes → extract exact value ("99990", "328", "hello"), including slight overflow outside box
+3. DRAWING: Only for actual SKETCHES/DIAGRAMS that cannot be typed → return "DR"
+4. BLANK: Only if completely empty with no marks at all → return "BL"
+
+NEVER return "DR" for numbers or text - those are free responses, not drawings!
+A drawing is a picture/sketch/diagram, NOT written characters.
+
+Return ONLY valid JSON:
+{
+    "candidate_name": str|null,
+    "candidate_number": str|null,
+    "country": str|null,
+    "paper_type": str|null,
+    "answers": {"1": "B", "2": "C", "3": "99990", ...}
+}"""
+
     def __init__(
         self,
         model: genai.GenerativeModel,
@@ -459,7 +520,7 @@ Return ONLY the JSON object."""
             return self._parse_json_response(response.text)
 
         except Exception as e:
-            logger.error(f"Header extraction failed: {e}")
+            logger.error("Header extraction failed: %s", e)
             return {}
 
     def extract_answers(
@@ -495,7 +556,7 @@ Return ONLY the JSON object."""
             return self._parse_json_response(response.text)
 
         except Exception as e:
-            logger.error(f"Answer extraction failed: {e}")
+            logger.error("Answer extraction failed: %s", e)
             # Return BL for all questions on failure
             return {
                 str(q): "BL"
@@ -551,11 +612,11 @@ Return ONLY the JSON object."""
                     if normalized in option_set:
                         data["answers"][str(q)] = normalized
 
-            logger.info(f"LLM extraction successful: {len(data.get('answers', {}))} answers")
+            logger.info("LLM extraction successful: %s answers", len(data.get('answers', {})))
             return self._data_to_extraction(data, format, extraction_method="llm_full")
 
         except Exception as e:
-            logger.error(f"Full extraction failed: {e}")
+            logger.error("Full extraction failed: %s", e)
             return CandidateExtraction(
                 page_number=0,
                 errors=[str(e)],
@@ -569,28 +630,13 @@ Return ONLY the JSON object."""
         options: List[str]
     ) -> Dict[str, str]:
         """Focused MCQ-only extraction for better accuracy."""
-        prompt = f"""TASK: Extract MCQ answers from questions {mcq_range[0]} to {mcq_range[1]}.
+        example_keys = ', '.join(f'"{q}": "?"' for q in range(mcq_range[0], min(mcq_range[0] + 3, mcq_range[1] + 1)))
+        prompt = f"""{self.MCQ_FOCUSED_RULES}
 
+TASK: Extract MCQ answers from questions {mcq_range[0]} to {mcq_range[1]}.
 Each question row has {len(options)} option areas labeled: {', '.join(options)}
-Students mark by X/fill/shade/check, or by coloring a box under the chosen option.
 
-HOW TO READ EACH ROW:
-1. Find the question number on the left
-2. Look across the row at each option area ({', '.join(options)})
-3. Identify which ONE option area has a clear deliberate mark
-4. Return the PRINTED LETTER LABEL of that marked option
-
-IMPORTANT DISTINCTIONS:
-- A MARKED option area: has visible X/fill/shading/check/tick/dot or colored box under label
-- An UNMARKED option area: empty/clear/pristine with no deliberate mark
-- Each question has exactly ONE answer - find the ONE marked option
-- If truly no option is marked, return "BL"
-- If more than one option is clearly marked, return "IN"
-
-Return JSON with question numbers as keys:
-{{{', '.join([f'"{q}": "?"' for q in range(mcq_range[0], min(mcq_range[0]+3, mcq_range[1]+1))])}...}}
-
-Return ONLY the JSON object."""
+Return JSON like: {{{example_keys}...}}"""
 
         try:
             response = self.model.generate_content(
@@ -602,7 +648,7 @@ Return ONLY the JSON object."""
             )
             return self._parse_json_response(response.text)
         except Exception as e:
-            logger.warning(f"Focused MCQ extraction failed: {e}")
+            logger.warning("Focused MCQ extraction failed: %s", e)
             return {}
 
     def _build_full_extraction_prompt(self, format: ExamFormat) -> str:
@@ -653,33 +699,15 @@ These are questions where students DRAW pictures, diagrams, or sketches.
 - A drawing is something you cannot type - it must be sketched/drawn
 """
 
-        return f"""Extract all data from this exam answer sheet image.
+        return f"""{self.FULL_EXTRACTION_RULES}
 
+THIS SHEET:
 STEP 1 - HEADER INFORMATION:
 Extract: {', '.join(header_keys)}
 Look for labeled fields at the top of the sheet.
 
 STEP 2 - ANSWERS:
-{mcq_instruction}{numeric_instruction}{drawing_instruction}
-Return JSON:
-{{
-    "candidate_name": str|null,
-    "candidate_number": str|null,
-    "country": str|null,
-    "paper_type": str|null,
-    "answers": {{"1": "B", "2": "C", "3": "99990", ...}}
-}}
-
-CRITICAL RULES:
-1. MCQ: Look for marked option areas (bubble/box/colored area under option) and return the PRINTED letter label
-2. FREE RESPONSE: Numbers/text WRITTEN in boxes → extract exact value ("99990", "328", "hello"), including slight overflow outside box
-3. DRAWING: Only for actual SKETCHES/DIAGRAMS that cannot be typed → return "DR"
-4. BLANK: Only if completely empty with no marks at all → return "BL"
-
-NEVER return "DR" for numbers or text - those are free responses, not drawings!
-A drawing is a picture/sketch/diagram, NOT written characters.
-
-Return ONLY valid JSON."""
+{mcq_instruction}{numeric_instruction}{drawing_instruction}"""
 
     def _parse_json_response(self, text: str) -> Dict:
         """Parse JSON from LLM response with tolerant fallbacks."""
@@ -689,10 +717,13 @@ Return ONLY valid JSON."""
 
         candidates: List[str] = []
 
-        # 1) JSON inside fenced code blocks
-        fence = re.search(r"```(?:json)?\s*(.*?)\s*```", raw, re.IGNORECASE | re.DOTALL)
-        if fence:
-            candidates.append(fence.group(1).strip())
+        # 1) JSON inside fenced code blocks; the common wrapping fence needs no regex
+        if raw.startswith("```") and raw.endswith("```"):
+            candidates.append(_strip_fence(raw))
+        elif "```" in raw:
+            fence = _JSON_FENCE_RE.search(raw)
+            if fence:
+                candidates.append(fence.group(1).strip())
 
         # 2) Entire response as-is
         candidates.append(raw)
@@ -709,7 +740,7 @@ Return ONLY valid JSON."""
                 continue
             seen.add(candidate)
             try:
-                parsed = json.loads(candidate)
+                parsed = _json_loads(candidate)
             except json.JSONDecodeError:
                 continue
             if isinstance(parsed, dict):
@@ -980,11 +1011,15 @@ class RefactoredPipeline:
     def process_images(
         self,
         images: List[Image.Image],
-        progress_callback: Optional[callable] = None
+        progress_callback: Optional[callable] = None,
+        max_workers: Optional[int] = None
     ) -> List[CandidateExtraction]:
         """
         Main entry point: process list of page images.
 
+        max_workers overrides the pipeline default for this call; the pool is
+        never larger than the number of pages to extract.
+
         Pipeline stages:
         1. Analyze all pages (CV)
         2. Cluster by layout
@@ -993,7 +1028,7 @@ class RefactoredPipeline:
         """
         results = []
         total_pages = len(images)
-        logger.info(f"Starting optimized pipeline with {total_pages} pages")
+        logger.info("Starting optimized pipeline with %s pages", total_pages)
 
         # Stage 2-3: Analyze all pages
         if progress_callback:
@@ -1003,23 +1038,22 @@ class RefactoredPipeline:
         for i, img in enumerate(images):
             layout = self.page_analyzer.analyze_page(img, i + 1)
             layouts.append(layout)
-            logger.debug(f"Page {i + 1}: blank={layout.is_blank}, hash={layout.layout_hash}")
+            logger.debug("Page %s: blank=%s, hash=%s", i + 1, layout.is_blank, layout.layout_hash)
             if progress_callback:
                 progress_callback(f"Analyzed page {i+1}", i + 1, total_pages)
 
         # Filter non-blank pages
         valid_layouts = [l for l in layouts if not l.is_blank]
-        logger.info(f"Found {len(valid_layouts)} non-blank pages out of {total_pages}")
+        logger.info("Found %s non-blank pages out of %s", len(valid_layouts), total_pages)
 
         if len(valid_layouts) == 0:
             logger.warning("All pages detected as blank! Returning empty results.")
             return results
 
         # Stage 3: Cluster layouts
-        from backend.services.page_analyzer import LayoutClusterer
         clusterer = LayoutClusterer()
         clusters = clusterer.cluster_layouts(valid_layouts)
-        logger.info(f"Detected {len(clusters)} unique exam formats: {list(clusters.keys())}")
+        logger.info("Detected %s unique exam formats: %s", len(clusters), list(clusters.keys()))
 
         # Stage 4: Detect format per cluster (ONE LLM call per unique layout)
         formats: Dict[str, ExamFormat] = {}
@@ -1028,50 +1062,52 @@ class RefactoredPipeline:
             rep_image = images[rep_page - 1]
             rep_layout = layouts[rep_page - 1]
 
-            logger.info(f"Detecting format for cluster {layout_hash} using page {rep_page}")
+            logger.info("Detecting format for cluster %s using page %s", layout_hash, rep_page)
             exam_format = self.format_detector.detect_format(rep_image, rep_layout)
             formats[layout_hash] = exam_format
-            logger.info(f"Format {layout_hash}: {exam_format.description}, mcq={exam_format.question_ranges.get('mcq')}")
+            logger.info("Format %s: %s, mcq=%s", layout_hash, exam_format.description, exam_format.question_ranges.get('mcq'))
 
         # Stage 5-7: Extract per page
         if progress_callback:
             progress_callback("Extracting answers...", 0, len(valid_layouts))
 
         # Process pages in parallel
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+        workers = max(1, min(max_workers or self.max_workers, len(valid_layouts)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
             futures = {}
             for layout in valid_layouts:
                 img = images[layout.page_number - 1]
                 exam_format = formats.get(layout.format_group)
                 if exam_format is None:
-                    logger.warning(f"No format for page {layout.page_number}, format_group={layout.format_group}")
+                    logger.warning("No format for page %s, format_group=%s", layout.page_number, layout.format_group)
                 future = executor.submit(
                     self._extract_page, img, layout, exam_format
                 )
                 futures[future] = layout.page_number
 
             completed = 0
+            by_page: Dict[int, CandidateExtraction] = {}
             for future in as_completed(futures):
                 page_num = futures[future]
                 try:
                     extraction = future.result()
                     extraction.page_number = page_num
-                    results.append(extraction)
-                    logger.info(f"Page {page_num} extracted: {len(extraction.answers)} answers, method={extraction.extraction_method}")
+                    by_page[page_num] = extraction
+                    logger.info("Page %s extracted: %s answers, method=%s", page_num, len(extraction.answers), extraction.extraction_method)
                 except Exception as e:
-                    logger.error(f"Page {page_num} extraction failed: {e}")
-                    results.append(CandidateExtraction(
+                    logger.error("Page %s extraction failed: %s", page_num, e)
+                    by_page[page_num] = CandidateExtraction(
                         page_number=page_num,
                         errors=[str(e)]
-                    ))
+                    )
 
                 completed += 1
                 if progress_callback:
                     progress_callback(f"Extracted page {page_num}", completed, len(valid_layouts))
 
-        # Sort by page number
-        results.sort(key=lambda x: x.page_number)
-        logger.info(f"Pipeline complete: {len(results)} candidates extracted")
+        # valid_layouts is in page order and every page produced one entry: no sort needed
+        results = [by_page[layout.page_number] for layout in valid_layouts]
+        logger.info("Pipeline complete: %s candidates extracted", len(results))
         return results
 
     def _extract_page(
@@ -1083,7 +1119,7 @@ class RefactoredPipeline:
         """Extract data from a single page."""
         # Handle case where format is None (defensive)
         if format is None:
-            logger.warning(f"No format detected for page {layout.page_number}, using fallback")
+            logger.warning("No format detected for page %s, using fallback", layout.page_number)
             format = self.format_detector._create_fallback_format(layout.layout_hash or "unknown")
 
         # Attempt CV-based answer classification first
@@ -2,6 +2,7 @@
 Gemini model selection helpers.
 Provides safe model fallback selection with a single shared implementation.
 """
+from functools import lru_cache
 from typing import List, Optional, Tuple
 import logging
 
@@ -11,6 +12,9 @@ from backend.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# API key genai was last configured with; configure() swaps global SDK state.
+_configured_api_key: Optional[str] = None
+
 
 def _parse_models(raw: str) -> List[str]:
     return [item.strip() for item in (raw or "").split(",") if item.strip()]
@@ -38,7 +42,8 @@ def _candidate_models(preferred_model: Optional[str] = None) -> List[str]:
     return ordered
 
 
-def _resolve_available_model(candidates: List[str]) -> str:
+def _resolve_available_model(candidates: Tuple[str, ...]) -> str:
+    """Pick the first available candidate, or the primary one if models cannot be listed."""
     settings = get_settings()
     if not candidates:
         return "gemini-2.0-flash"
@@ -47,39 +52,55 @@ def _resolve_available_model(candidates: List[str]) -> str:
         return candidates[0]
 
     try:
-        available = set()
-        for model in genai.list_models():  # type: ignore[attr-defined]
-            methods = set(getattr(model, "supported_generation_methods", []) or [])
-            if "generateContent" not in methods:
-                continue
-
-            model_name = str(getattr(model, "name", "") or "")
-            if not model_name:
-                continue
-            short_name = model_name.split("/")[-1]
-            available.add(model_name.lower())
-            available.add(short_name.lower())
-
-        for candidate in candidates:
-            if candidate.lower() in available:
-                if candidate.lower() != candidates[0].lower():
-                    logger.warning(
-                        "Primary Gemini model '%s' unavailable, using fallback '%s'",
-                        candidates[0],
-                        candidate,
-                    )
-                return candidate
-
-        logger.warning(
-            "None of configured Gemini models were discovered by list_models; using '%s'",
-            candidates[0],
-        )
-        return candidates[0]
+        return _discover_available_model(candidates)
     except Exception as exc:
+        # Not cached: the next model creation asks list_models again
         logger.warning("Could not list Gemini models for fallback resolution: %s", exc)
         return candidates[0]
 
 
+@lru_cache(maxsize=4)
+def _discover_available_model(candidates: Tuple[str, ...]) -> str:
+    """First candidate list_models reports; cached so list_models runs once per candidate list.
+
+    A list_models failure propagates, so only successful resolutions are cached.
+    """
+    available = set()
+    for model in genai.list_models():  # type: ignore[attr-defined]
+        methods = set(getattr(model, "supported_generation_methods", []) or [])
+        if "generateContent" not in methods:
+            continue
+
+        model_name = str(getattr(model, "name", "") or "")
+        if not model_name:
+            continue
+        short_name = model_name.split("/")[-1]
+        available.add(model_name.lower())
+        available.add(short_name.lower())
+
+    for candidate in candidates:
+        if candidate.lower() in available:
+            if candidate.lower() != candidates[0].lower():
+                logger.warning(
+                    "Primary Gemini model '%s' unavailable, using fallback '%s'",
+                    candidates[0],
+                    candidate,
+                )
+            return candidate
+
+    logger.warning(
+        "None of configured Gemini models were discovered by list_models; using '%s'",
+        candidates[0],
+    )
+    return candidates[0]
+
+
+@lru_cache(maxsize=4)
+def get_gemini_model(model_name: str, system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+    """Shared model handle per (model, system instruction); handles hold no per-call state."""
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)  # type: ignore[attr-defined]
+
+
 def create_gemini_model(
     api_key: Optional[str] = None,
     preferred_model: Optional[str] = None,
@@ -88,10 +109,15 @@ def create_gemini_model(
     Configure Gemini client and create a model with fallback-aware selection.
     Returns (model_instance, selected_model_name).
     """
+    global _configured_api_key
     settings = get_settings()
     final_api_key = api_key if api_key is not None else settings.gemini_api_key
-    genai.configure(api_key=final_api_key)  # type: ignore[attr-defined]
-
-    selected = _resolve_available_model(_candidate_models(preferred_model=preferred_model))
-    model = genai.GenerativeModel(selected)  # type: ignore[attr-defined]
-    return model, selected
+    if final_api_key != _configured_api_key:
+        genai.configure(api_key=final_api_key)  # type: ignore[attr-defined]
+        _configured_api_key = final_api_key
+        # Discovery results and model handles belong to the previous key
+        _discover_available_model.cache_clear()
+        get_gemini_model.cache_clear()
+
+    selected = _resolve_available_model(tuple(_candidate_models(preferred_model=preferred_model)))
+    return get_gemini_model(selected), selected
@@ -6,9 +6,13 @@ from PIL import Image, ImageStat
 import cv2
 import numpy as np
 import logging
+from typing import BinaryIO, Union
 
 logger = logging.getLogger(__name__)
 
+# Gemini downsamples anything larger server-side, so bigger pages only cost wire bytes.
+MAX_MODEL_IMAGE_DIMENSION = 3072
+
 
 class ImagePreprocessor:
     """A class to perform pre-processing checks on images."""
@@ -117,6 +121,16 @@ class ImagePreprocessor:
         final_rgb = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2RGB)
         return Image.fromarray(final_rgb)
 
+    @staticmethod
+    def open_for_model(image_path: Union[str, BinaryIO], max_dimension: int = MAX_MODEL_IMAGE_DIMENSION) -> Image.Image:
+        """Load an image (path or binary file object) as RGB, downscaled so neither side exceeds max_dimension."""
+        with Image.open(image_path) as raw:
+            # JPEG can decode straight at a reduced scale; a no-op for other formats.
+            raw.draft("RGB", (max_dimension, max_dimension))
+            image = raw.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        return image
+
     @staticmethod
     def preprocess_image_path(image_path: str, mode: str = "balanced") -> Image.Image:
         """Load and preprocess an image path for extraction."""
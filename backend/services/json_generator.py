@@ -15,13 +15,45 @@ Auto-marking codes:
   <student_answer> = wrong MCQ answer (e.g. "B" when correct was "D")
 """
 import json
+from collections import Counter
 from typing import Dict, List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
+def _dumps(obj, indent: bool = True) -> str:
+    """Serialize obj as JSON, with orjson when available.
+
+    indent=True gives two-space indentation for people reading stored results;
+    indent=False gives compact output for API consumers.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+# Internal keys dropped from candidates in generated output
+_INTERNAL_KEYS = frozenset({"page_number"})
+
+
+def _public_candidates(extraction_result: Dict) -> List[Dict]:
+    """Copy every candidate with all keys except internal metadata."""
+    return [
+        {k: v for k, v in raw.items() if k not in _INTERNAL_KEYS}
+        for raw in extraction_result.get("candidates", [])
+    ]
+
+
 class JSONGenerator:
     """Generates structured JSON from extracted exam data"""
     
@@ -29,25 +61,18 @@ class JSONGenerator:
     def generate(
         filename: str,
         extraction_result: Dict,
-        validation_result: Optional[Dict] = None
+        validation_result: Optional[Dict] = None,
+        indent: bool = True,
     ) -> str:
         """Generate the flat per-candidate JSON from extraction results.
 
         All header fields returned by the AI extractor are preserved as-is,
         so this works with any exam format (UZ1, ZONE Z, etc.).
+        Pass indent=False for compact machine-consumed output.
         """
-        candidates_raw = extraction_result.get("candidates", [])
-
-        candidates = []
-        for raw in candidates_raw:
-            # Copy every key EXCEPT internal metadata
-            candidate = {
-                k: v for k, v in raw.items()
-                if k not in ("page_number",)
-            }
-            candidates.append(candidate)
+        candidates = _public_candidates(extraction_result)
 
-        json_str = json.dumps(candidates, indent=2, ensure_ascii=False)
+        json_str = _dumps(candidates, indent)
         logger.info(f"Generated JSON for {filename}: {len(candidates)} candidates, {len(json_str)} bytes")
         return json_str
     
@@ -55,26 +80,29 @@ class JSONGenerator:
     def generate_with_validation(
         filename: str,
         extraction_result: Dict,
-        validation_result: Optional[Dict] = None
+        validation_result: Optional[Dict] = None,
+        indent: bool = True,
     ) -> str:
         """Generate JSON with metadata envelope for storage.
 
         Preserves all dynamic header fields from the AI extractor.
+        Pass indent=False for compact machine-consumed output.
         """
-        candidates_raw = extraction_result.get("candidates", [])
+        return _dumps(JSONGenerator.build_with_validation(filename, extraction_result, validation_result), indent)
 
-        candidates = []
-        for raw in candidates_raw:
-            candidate = {
-                k: v for k, v in raw.items()
-                if k not in ("page_number",)
-            }
-            candidates.append(candidate)
+    @staticmethod
+    def build_with_validation(
+        filename: str,
+        extraction_result: Dict,
+        validation_result: Optional[Dict] = None
+    ) -> Dict:
+        """Build the generate_with_validation envelope as a dict, e.g. for LocalStorage.save_json_obj."""
+        candidates = _public_candidates(extraction_result)
 
         output = {
             "document_information": {
                 "filename": filename,
-                "extraction_timestamp": datetime.utcnow().isoformat(),
+                "extraction_timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
                 "total_candidates": len(candidates),
                 "pages_processed": extraction_result.get("pages_processed", 0),
                 "pages_with_data": extraction_result.get("pages_with_data", 0),
@@ -97,14 +125,14 @@ class JSONGenerator:
         if logs:
             output["logs"] = logs
 
-        json_str = json.dumps(output, indent=2, ensure_ascii=False)
         logger.info(f"Generated validated JSON for {filename}: {len(candidates)} candidates")
-        return json_str
+        return output
 
     @staticmethod
     def generate_minimal(
         filename: str,
         extraction_result: Dict,
+        indent: bool = True,
     ) -> str:
         """Generate a minimal JSON output for downstream consumption.
 
@@ -122,10 +150,12 @@ class JSONGenerator:
         output_candidates = []
 
         for raw in candidates_raw:
-            answers = dict(raw.get("answers") or {})
-            drawing = raw.get("drawing_questions") or {}
-            for q in drawing.keys():
-                answers[str(q)] = "DR"
+            answers = raw.get("answers") or {}
+            drawing = raw.get("drawing_questions")
+            # The extractor already folds drawing questions into answers as DR,
+            # so the answers dict is only copied when there is something to merge.
+            if drawing:
+                answers = {**answers, **dict.fromkeys(map(str, drawing), "DR")}
 
             candidate_number = (
                 raw.get("candidate_number")
@@ -141,7 +171,7 @@ class JSONGenerator:
                 "paper_type": str(paper_type) if paper_type is not None else "",
             })
 
-        json_str = json.dumps(output_candidates, indent=2, ensure_ascii=False)
+        json_str = _dumps(output_candidates, indent)
         logger.info(f"Generated minimal JSON for {filename}: {len(output_candidates)} candidates")
         return json_str
     
@@ -246,22 +276,20 @@ class JSONGenerator:
         
         total_answers = 0
         total_drawing = 0
-        answer_distribution: Dict[str, int] = {}
+        answer_distribution: Counter = Counter()
         
         for candidate in candidates:
             answers = candidate.get("answers", {})
             drawing = candidate.get("drawing_questions", {})
             total_answers += len(answers)
             total_drawing += len(drawing)
-            
-            for answer in answers.values():
-                answer_distribution[answer] = answer_distribution.get(answer, 0) + 1
+            answer_distribution.update(answers.values())
         
         return {
             "total_candidates": len(candidates),
             "total_answers": total_answers,
             "total_drawing_questions": total_drawing,
-            "answer_distribution": answer_distribution,
+            "answer_distribution": dict(answer_distribution),
             "pages_processed": extraction_result.get("pages_processed", 0),
             "pages_with_data": extraction_result.get("pages_with_data", 0),
             "processing_time": extraction_result.get("processing_time", 0),
@@ -279,7 +307,8 @@ class JSONGenerator:
             Parsed dict or list
         """
         try:
-            return json.loads(json_str)
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            return orjson.loads(json_str) if orjson is not None else json.loads(json_str)
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON: {str(e)}")
             return {}
@@ -349,6 +378,12 @@ class JSONGenerator:
         return "\n".join(lines)
 
 
+_json_generator: Optional[JSONGenerator] = None
+
+
 def get_json_generator() -> JSONGenerator:
-    """Factory function to create JSONGenerator instance"""
-    return JSONGenerator()
+    """Get or create JSONGenerator singleton instance"""
+    global _json_generator
+    if _json_generator is None:
+        _json_generator = JSONGenerator()
+    return _json_generator
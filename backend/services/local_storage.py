@@ -1,18 +1,37 @@
 """
 Local file storage utilities for saving and retrieving uploads/results.
 """
+import hashlib
+import json
 import logging
 import os
-import shutil
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, BinaryIO, Dict
+from typing import Any, Optional, BinaryIO, Dict, List
 from uuid import uuid4
 
+import aiofiles
+
 from backend.config import get_settings
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
+ZSTD_SUFFIX = ".zst"
+ZSTD_LEVEL = 3
+
+# Uploads are hashed while copied, so they are read in large chunks rather than sendfile'd
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 class LocalStorage:
     """Simple local filesystem storage with upload/result directories."""
@@ -24,6 +43,12 @@ class LocalStorage:
         self.results_path = self.base_path / "results"
         for path in (self.base_path, self.uploads_path, self.results_path):
             path.mkdir(parents=True, exist_ok=True)
+        self._base_str = str(self.base_path)
+        self._base_prefix = os.path.join(self._base_str, "")
+        self.compress_json = bool(settings.compress_json_results)
+        if self.compress_json and zstandard is None:
+            logger.warning("COMPRESS_JSON_RESULTS is set but zstandard is not installed; storing plain JSON")
+            self.compress_json = False
         logger.info("Initialized LocalStorage at %s", self.base_path)
 
     def _safe_name(self, filename: str) -> str:
@@ -48,30 +73,117 @@ class LocalStorage:
             "absolute_path": str(path),
         }
 
-    def save_pdf(self, file_obj: BinaryIO, filename: str) -> Dict[str, str]:
-        """Persist a PDF upload to disk."""
-        final_name = self._unique_name(filename)
-        destination = self.uploads_path / final_name
+    def _partial_path(self) -> Path:
+        """Scratch path for an upload whose content hash is not known yet."""
+        return self.uploads_path / f".{uuid4().hex}.part"
+
+    def _store_by_content(self, partial: Path, sha256: str, filename: str) -> Dict[str, Any]:
+        """Move a fully written upload to ``<sha256>.pdf``, reusing an existing copy.
+
+        Identical uploads share one file on disk, so callers must check for
+        other references before deleting a PDF key (see ``delete_file``).
+        """
+        destination = self.uploads_path / f"{sha256}.pdf"
+        deduplicated = destination.exists()
+        if deduplicated:
+            partial.unlink(missing_ok=True)
+            logger.info("PDF %s already stored as %s", filename, destination.name)
+        else:
+            os.replace(partial, destination)
+            logger.info("Saved PDF %s to %s", filename, destination)
+        result = self._build_result(destination)
+        result["sha256"] = sha256
+        result["deduplicated"] = deduplicated
+        return result
+
+    def save_pdf(self, file_obj: BinaryIO, filename: str) -> Dict[str, Any]:
+        """Persist a PDF upload to disk under its content hash.
+
+        The result includes ``sha256`` (content digest) and ``deduplicated``
+        (True when identical bytes were already stored).
+        """
+        partial = self._partial_path()
+        digest = hashlib.sha256()
         file_obj.seek(0)
-        with open(destination, "wb") as dest:
-            shutil.copyfileobj(file_obj, dest)
-        logger.info("Saved PDF %s to %s", filename, destination)
-        return self._build_result(destination)
+        try:
+            with open(partial, "wb") as dest:
+                for chunk in iter(lambda: file_obj.read(UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    dest.write(chunk)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return self._store_by_content(partial, digest.hexdigest(), filename)
+
+    async def save_pdf_async(self, upload: Any, filename: str) -> Dict[str, Any]:
+        """Stream an upload (anything with ``async read(n)``, e.g. UploadFile) to disk.
+
+        Reads in 1 MiB chunks so memory stays bounded and the event loop is
+        never blocked; storage and result are content-addressed like save_pdf.
+        """
+        partial = self._partial_path()
+        digest = hashlib.sha256()
+        await upload.seek(0)
+        try:
+            async with aiofiles.open(partial, "wb") as dest:
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await dest.write(chunk)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return self._store_by_content(partial, digest.hexdigest(), filename)
 
     def save_json(self, json_data: str, filename: str) -> Dict[str, str]:
-        """Persist JSON results to disk."""
+        """Persist JSON results to disk (zstd-compressed as .json.zst when enabled)."""
+        return self._save_json_bytes(json_data.encode("utf-8"), filename)
+
+    def save_json_obj(self, obj: Any, filename: str) -> Dict[str, str]:
+        """Serialize obj straight to UTF-8 bytes and persist it like save_json.
+
+        Skips the intermediate str (and its encoded copy) that save_json needs.
+        """
+        if orjson is not None:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            data = json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+        return self._save_json_bytes(data, filename)
+
+    def _save_json_bytes(self, data: bytes, filename: str) -> Dict[str, str]:
         final_name = self._unique_name(filename, suffix="json")
+        if self.compress_json:
+            final_name += ZSTD_SUFFIX
+            data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
         destination = self.results_path / final_name
-        destination.write_text(json_data, encoding="utf-8")
+        destination.write_bytes(data)
         logger.info("Saved JSON %s to %s", filename, destination)
         return self._build_result(destination)
 
+    @staticmethod
+    def is_compressed(relative_path: Optional[str]) -> bool:
+        """True when a stored file is zstd-compressed."""
+        return bool(relative_path) and str(relative_path).endswith(ZSTD_SUFFIX)
+
+    def read_json_bytes(self, relative_path: str) -> Optional[bytes]:
+        """Read stored JSON results as UTF-8 bytes, decompressing if needed."""
+        data = self.read_bytes(relative_path)
+        if data is None or not self.is_compressed(relative_path):
+            return data
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {relative_path}")
+        return zstandard.ZstdDecompressor().decompress(data)
+
     def read_json(self, relative_path: str) -> Optional[str]:
         """Read stored JSON results; returns None if missing."""
+        data = self.read_json_bytes(relative_path)
+        return data.decode("utf-8") if data is not None else None
+
+    def read_bytes(self, relative_path: str) -> Optional[bytes]:
+        """Read a stored file as raw bytes; returns None if missing."""
         path = self.get_absolute_path(relative_path)
         if path and path.exists():
-            return path.read_text(encoding="utf-8")
-        logger.warning("JSON path %s not found", relative_path)
+            return path.read_bytes()
+        logger.warning("Stored file %s not found", relative_path)
         return None
 
     def delete_file(self, relative_path: Optional[str]) -> bool:
@@ -88,15 +200,23 @@ class LocalStorage:
                 logger.error("Failed to delete %s: %s", path, exc)
         return False
 
+    def delete_files(self, relative_paths: List[Optional[str]]) -> int:
+        """Delete several stored files (None entries skipped); returns how many were removed."""
+        return sum(1 for relative_path in relative_paths if self.delete_file(relative_path))
+
     def get_absolute_path(self, relative_path: Optional[str]) -> Optional[Path]:
+        """Absolute path for a stored key; None if empty or it points outside storage.
+
+        Normalized lexically against the already-resolved base path, so no
+        per-call resolve() stats.
+        """
         if not relative_path:
             return None
-        candidate = self.base_path / relative_path
-        try:
-            candidate = candidate.resolve()
-        except FileNotFoundError:
-            return candidate
-        return candidate
+        candidate = os.path.normpath(os.path.join(self._base_str, relative_path))
+        if candidate != self._base_str and not candidate.startswith(self._base_prefix):
+            logger.warning("Rejected stored path outside storage root: %s", relative_path)
+            return None
+        return Path(candidate)
 
 
 _local_storage: Optional[LocalStorage] = None
@@ -2,11 +2,15 @@
 OCR Engine Service
 Extracts text from images using Tesseract OCR
 """
+import numpy as np
 import pytesseract
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 import logging
+import os
 import re
+from operator import itemgetter
 from pathlib import Path
 import shutil
 
@@ -14,6 +18,22 @@ from backend.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Multiple choice answers in one pass: labelled (Q1: A, Q1) B, Question 1 - C)
+# or bare (1. A). "Question 1: A" is covered by the labelled branch.
+_MCQ_PATTERN = re.compile(
+    r"Q[uestion]*\s*(?P<labelled>\d+)\s*[:\-\)\.]*\s*(?P<labelled_answer>[A-E])"
+    r"|(?P<bare>\d+)\s*[:\-\)\.]\s*(?P<bare_answer>[A-E])",
+    re.IGNORECASE,
+)
+
+# Free responses: "Free Response 1:", "Essay Question 1:", etc. Each response
+# runs from its heading to the next anchor word (or the end of the text).
+_FR_ANCHOR = re.compile(r"FREE\s+RESPONSE|ESSAY|SHORT\s+ANSWER", re.IGNORECASE)
+_FR_HEADING = re.compile(
+    r"(?:FREE\s+RESPONSE|ESSAY|SHORT\s+ANSWER)\s+(?:QUESTION\s+)?(\d+)\s*[:\-]?\s*",
+    re.IGNORECASE,
+)
+
 
 class OCREngine:
     """OCR engine for text extraction from images"""
@@ -80,9 +100,9 @@ class OCREngine:
             Extracted text as string
         """
         try:
-            image = Image.open(image_path)
+            # A path goes straight to the tesseract CLI; a PIL image would be re-encoded to a temp file
             text = pytesseract.image_to_string(
-                image,
+                image_path,
                 lang=self.lang,
                 config=self.config
             )
@@ -124,14 +144,19 @@ class OCREngine:
         Returns:
             List of dicts with page number and extracted text
         """
-        results = []
-        for i, image_path in enumerate(image_paths, start=1):
-            text = self.extract_text(image_path)
-            results.append({
-                "page": i,
-                "image_path": image_path,
-                "text": text
-            })
+        # pytesseract runs the tesseract binary as a subprocess, so threads give
+        # one CPU-bound OCR process per core without pickling work to a process pool.
+        max_workers = max(1, min(len(image_paths), os.cpu_count() or 1))
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                texts = list(executor.map(self.extract_text, image_paths))
+        else:
+            texts = [self.extract_text(image_path) for image_path in image_paths]
+        
+        results = [
+            {"page": i, "image_path": image_path, "text": text}
+            for i, (image_path, text) in enumerate(zip(image_paths, texts), start=1)
+        ]
         
         logger.info(f"Extracted text from {len(image_paths)} images")
         return results
@@ -147,24 +172,21 @@ class OCREngine:
             Dict with text and confidence information
         """
         try:
-            image = Image.open(image_path)
             data = pytesseract.image_to_data(
-                image,
+                image_path,
                 lang=self.lang,
                 output_type=pytesseract.Output.DICT
             )
             
-            # Filter out low confidence results
-            text_parts = []
-            confidences = []
-            
-            for i, conf in enumerate(data['conf']):
-                if int(conf) > 0:  # Valid confidence score
-                    text_parts.append(data['text'][i])
-                    confidences.append(int(conf))
+            # Filter out low confidence results (tesseract reports -1 for non-word boxes)
+            conf = np.asarray(data['conf'], dtype=float).astype(np.int32)
+            valid = conf > 0
+            words = data['text']
+            text_parts = [words[i] for i in np.flatnonzero(valid)]
+            confidences = conf[valid]
             
             full_text = ' '.join(text_parts)
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            avg_confidence = float(confidences.mean()) if confidences.size else 0
             
             logger.info(f"Extracted text with avg confidence {avg_confidence:.2f}%")
             
@@ -192,32 +214,26 @@ class AnswerParser:
         Returns:
             List of dicts with question number and selected answer
         """
-        # Pattern matches: Q1: A, Q1) B, Q1 - C, 1. A, etc.
-        patterns = [
-            r"Q[uestion]*\s*(\d+)\s*[:\-\)\.]*\s*([A-E])",  # Q1: A
-            r"(\d+)\s*[:\-\)\.]\s*([A-E])",  # 1. A
-            r"Question\s+(\d+)\s*[:\-]*\s*([A-E])",  # Question 1: A
-        ]
+        labelled: Dict[str, str] = {}
+        bare: Dict[str, str] = {}
         
-        answers = []
-        seen_questions = set()
+        for match in _MCQ_PATTERN.finditer(text):
+            question_num = match.group("labelled")
+            if question_num is not None:
+                labelled.setdefault(question_num, match.group("labelled_answer").upper())
+            else:
+                bare.setdefault(match.group("bare"), match.group("bare_answer").upper())
         
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                question_num = match.group(1)
-                answer = match.group(2).upper()
-                
-                # Avoid duplicates
-                if question_num not in seen_questions:
-                    answers.append({
-                        "question": int(question_num),
-                        "answer": answer
-                    })
-                    seen_questions.add(question_num)
+        # First match wins per question; a labelled answer beats a bare one
+        for question_num, answer in bare.items():
+            labelled.setdefault(question_num, answer)
+        answers = [
+            {"question": int(question_num), "answer": answer}
+            for question_num, answer in labelled.items()
+        ]
         
         # Sort by question number
-        answers.sort(key=lambda x: x['question'])
+        answers.sort(key=itemgetter('question'))
         
         logger.info(f"Extracted {len(answers)} multiple choice answers")
         return answers
@@ -235,22 +251,21 @@ class AnswerParser:
         """
         responses = []
         
-        # Look for patterns like "Free Response 1:", "Essay Question 1:", etc.
-        patterns = [
-            r"(?:FREE\s+RESPONSE|ESSAY|SHORT\s+ANSWER)\s+(?:QUESTION\s+)?(\d+)\s*[:\-]?\s*(.*?)(?=(?:FREE\s+RESPONSE|ESSAY|SHORT\s+ANSWER|\Z))",
-        ]
+        # One linear scan for anchors instead of a lazy .*? + lookahead per match
+        starts = [anchor.start() for anchor in _FR_ANCHOR.finditer(text)]
+        starts.append(len(text))
         
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.DOTALL)
-            for match in matches:
-                question_num = match.group(1)
-                response_text = match.group(2).strip()
-                
-                if response_text:
-                    responses.append({
-                        "question": int(question_num),
-                        "response": response_text
-                    })
+        for start, next_start in zip(starts, starts[1:]):
+            heading = _FR_HEADING.match(text, start)
+            if heading is None:
+                continue
+            response_text = text[heading.end():next_start].strip()
+            
+            if response_text:
+                responses.append({
+                    "question": int(heading.group(1)),
+                    "response": response_text
+                })
         
         logger.info(f"Extracted {len(responses)} free response answers")
         return responses
@@ -118,7 +118,8 @@ class OCRResultsWriter:
 
                 text = self.ocr_engine.extract_from_pil(page_image)
                 stats = self._confidence_stats(page_image, self.ocr_engine.lang)
-                word_count = len([piece for piece in (text or "").split() if piece.strip()])
+                # split() already drops empty pieces; skip it entirely for blank text
+                word_count = len(text.split()) if text else 0
 
                 page_file.write_text(text or "", encoding="utf-8")
 
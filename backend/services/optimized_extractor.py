@@ -4,14 +4,18 @@ Provides backwards-compatible interface while using optimized internals.
 """
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from dataclasses import asdict
 
 from backend.config import get_settings
+from backend.db.models import ProcessingLog
 from backend.services.extraction_pipeline import (
     RefactoredPipeline,
     CandidateExtraction,
-    ExamFormat
+    ExamFormat,
+    PROMPT_VERSION,
 )
 from backend.services.page_analyzer import PageAnalyzer, PageLayout
 from backend.services.image_preprocessor import ImagePreprocessor
@@ -26,6 +30,8 @@ class OptimizedAIExtractor:
     Maintains the same interface for backwards compatibility.
     """
 
+    prompt_version = PROMPT_VERSION
+
     def __init__(
         self,
         api_key: str = None,
@@ -58,11 +64,11 @@ class OptimizedAIExtractor:
             self._preprocess_mode,
         )
 
-    def _load_image(self, image_path: str):
-        from PIL import Image
+    def _prepare_image(self, image_path: str):
+        return ImagePreprocessor.open_for_model(image_path)
 
-        with Image.open(image_path) as raw:
-            image = raw.convert("RGB")
+    def _load_image(self, image_path: str):
+        image = self._prepare_image(image_path)
         if not self._preprocess_enabled:
             return image
         return self._image_preprocessor.preprocess_pil_image(
@@ -78,7 +84,7 @@ class OptimizedAIExtractor:
         try:
             image = self._load_image(image_path)
         except Exception as e:
-            logger.error(f"Failed to load image {image_path}: {e}")
+            logger.error("Failed to load image %s: %s", image_path, e)
             # Return default format on error
             return {
                 "header_fields": [
@@ -126,7 +132,7 @@ class OptimizedAIExtractor:
         try:
             image = self._load_image(image_path)
         except Exception as e:
-            logger.error(f"Failed to load image {image_path}: {e}")
+            logger.error("Failed to load image %s: %s", image_path, e)
             return {"error": str(e), "answers": {}, "drawing_questions": {}}
 
         # Analyze layout
@@ -164,19 +170,24 @@ class OptimizedAIExtractor:
             use_parallel: Whether to use parallel processing
             max_workers: Number of parallel workers
         """
-        import time
-
         start_time = time.time()
 
-        # Load images from paths
-        images = []
-        for path in image_paths:
+        def _try_load(path: str):
             try:
-                img = self._load_image(path)
-                images.append(img)
+                return self._load_image(path)
             except Exception as e:
-                logger.error(f"Failed to load image {path}: {e}")
-                continue
+                logger.error("Failed to load image %s: %s", path, e)
+                return None
+
+        # Decode + preprocess pages concurrently (PIL/OpenCV release the GIL);
+        # map() keeps page order
+        load_workers = max(1, min(max_workers if use_parallel else 1, len(image_paths)))
+        if load_workers > 1:
+            with ThreadPoolExecutor(max_workers=load_workers) as executor:
+                loaded = list(executor.map(_try_load, image_paths))
+        else:
+            loaded = [_try_load(path) for path in image_paths]
+        images = [img for img in loaded if img is not None]
 
         if not images:
             return {
@@ -193,7 +204,11 @@ class OptimizedAIExtractor:
                 self._log_progress(db, submission_id, message, current, total)
 
         # Use the pipeline
-        extractions = self.pipeline.process_images(images, progress_callback)
+        extractions = self.pipeline.process_images(
+            images,
+            progress_callback,
+            max_workers=max_workers if use_parallel else 1,
+        )
 
         # Convert to legacy format
         candidates = []
@@ -345,7 +360,6 @@ class OptimizedAIExtractor:
         total: int
     ):
         """Log progress to database."""
-        from backend.db.models import ProcessingLog
         try:
             log = ProcessingLog(
                 submission_id=submission_id,
@@ -357,7 +371,7 @@ class OptimizedAIExtractor:
             db_session.add(log)
             db_session.commit()
         except Exception as e:
-            logger.warning(f"Failed to log progress: {e}")
+            logger.warning("Failed to log progress: %s", e)
 
 
 # Factory function for easy switching
@@ -4,8 +4,10 @@ Handles file upload/download operations with S3-compatible storage
 """
 import boto3
 import botocore
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from typing import Optional, BinaryIO
+from typing import List, Optional, BinaryIO
 import logging
 from backend.config import get_settings
 from datetime import datetime
@@ -14,6 +16,15 @@ from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Stream uploads in 8 MiB multipart chunks instead of buffering whole files
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    use_threads=True,
+)
+
+IMAGE_CONTENT_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+
 
 class SpacesClient:
     """Client for interacting with DigitalOcean Spaces (S3-compatible)"""
@@ -27,7 +38,9 @@ class SpacesClient:
             region_name=settings.spaces_region,
             endpoint_url=settings.spaces_endpoint,
             aws_access_key_id=settings.spaces_key,
-            aws_secret_access_key=settings.spaces_secret
+            aws_secret_access_key=settings.spaces_secret,
+            # Parallel page archiving shares this client; keep enough warm connections
+            config=Config(max_pool_connections=50),
         )
         self.bucket = settings.spaces_bucket
         logger.info(f"Initialized SpacesClient for bucket: {self.bucket}")
@@ -49,7 +62,8 @@ class SpacesClient:
                 file_obj,
                 self.bucket,
                 key,
-                ExtraArgs={'ContentType': 'application/pdf'}
+                ExtraArgs={'ContentType': 'application/pdf'},
+                Config=TRANSFER_CONFIG,
             )
             
             url = f"{get_settings().spaces_endpoint}/{self.bucket}/{key}"
@@ -115,13 +129,14 @@ class SpacesClient:
                 f"submission_{submission_id}/{pdf_base_name}/{image_base_name}"
             )
             
-            with open(image_path, "rb") as f:
-                self.client.upload_fileobj(
-                    f,
-                    self.bucket,
-                    key,
-                    ExtraArgs={'ContentType': 'image/png'}
-                )
+            # upload_file streams from disk (and can use parallel parts)
+            self.client.upload_file(
+                image_path,
+                self.bucket,
+                key,
+                ExtraArgs={'ContentType': IMAGE_CONTENT_TYPES.get(Path(image_path).suffix.lower(), 'image/png')},
+                Config=TRANSFER_CONFIG,
+            )
             
             logger.info(f"Archived image to Spaces: {key}")
             return key
@@ -148,7 +163,7 @@ class SpacesClient:
             True if successful, False otherwise
         """
         try:
-            self.client.download_file(self.bucket, key, local_path)
+            self.client.download_file(self.bucket, key, local_path, Config=TRANSFER_CONFIG)
             logger.info(f"Successfully downloaded PDF from {key} to {local_path}")
             return True
         except ClientError as e:
@@ -218,6 +233,36 @@ class SpacesClient:
             logger.error(f"Failed to delete file {key}: {str(e)}")
             return False
     
+    def delete_files(self, keys: List[Optional[str]]) -> int:
+        """
+        Delete several files from Spaces with batched DeleteObjects calls
+        
+        Args:
+            keys: Object keys to delete (None entries are skipped)
+            
+        Returns:
+            Number of objects deleted
+        """
+        keys = [key for key in keys if key]
+        deleted = 0
+        # DeleteObjects accepts up to 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+            except ClientError as e:
+                logger.error(f"Failed to delete {len(batch)} files: {str(e)}")
+                continue
+            errors = response.get('Errors', [])
+            for error in errors:
+                logger.error(f"Failed to delete file {error.get('Key')}: {error.get('Message')}")
+            deleted += len(batch) - len(errors)
+        logger.info(f"Deleted {deleted} of {len(keys)} files")
+        return deleted
+    
     def get_file_url(self, key: str, expiration: int = 3600) -> Optional[str]:
         """
         Generate a presigned URL for temporary file access
@@ -2,9 +2,12 @@
 Celery worker for background task processing
 """
 from celery import Celery
+from sqlalchemy import insert
 import logging
 from datetime import datetime
 from pathlib import Path
+import shutil
+import tempfile
 
 from backend.config import get_settings
 from backend.db.database import SessionLocal
@@ -33,6 +36,7 @@ celery_app = Celery(
 
 celery_app.conf.task_routes = {
     'backend.worker.process_exam_pdf': {'queue': 'exam_processing'},
+    'backend.worker.extract_submission': {'queue': 'exam_processing'},
 }
 
 celery_app.conf.update(
@@ -41,20 +45,33 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # Extraction jobs are long; hand out one at a time per worker process
+    worker_prefetch_multiplier=1,
 )
 
 
+@celery_app.task(name='backend.worker.extract_submission', bind=True, acks_late=True)
+def extract_submission(self, submission_id: int, pdf_path: str, pdf_sha256: str = None):
+    """Run the API's extraction pipeline for an uploaded submission (USE_CELERY_WORKER)."""
+    # Imported lazily: the routes module pulls in the whole API stack
+    from backend.api.routes import process_pdf_extraction
+    process_pdf_extraction(submission_id, pdf_path, pdf_sha256)
+    return {"status": "done", "submission_id": submission_id}
+
+
 @celery_app.task(name='backend.worker.process_exam_pdf')
 def process_exam_pdf(submission_id: int):
     db = SessionLocal()
+    work_dir = None
     try:
-        sub = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
+        sub = db.get(ExamSubmission, submission_id)
         if not sub:
             logger.error(f"Submission {submission_id} not found")
             return {"status": "error", "message": "Submission not found"}
         logger.info(f"Processing submission {submission_id}: {getattr(sub,'filename')}")
+        # Only the start of processing is committed early so /status sees it;
+        # everything else lands in the final commit
         setattr(sub,'status','processing')
-        db.commit()
         db.add(ProcessingLog(
             submission_id=submission_id,
             action="extract_start",
@@ -69,9 +86,9 @@ def process_exam_pdf(submission_id: int):
         pdf_path = str(pdf_path_obj)
         logger.info(f"Converting PDF to images: {pdf_path}")
         pdf_converter = get_pdf_converter()
-        image_paths = pdf_converter.convert_from_file(pdf_path)
+        work_dir = tempfile.mkdtemp(prefix=f"submission_{submission_id}_")
+        image_paths = pdf_converter.convert_from_file(pdf_path, output_dir=work_dir)
         setattr(sub,'pages_count', len(image_paths))
-        db.commit()
 
         if settings.save_ocr_results and image_paths:
             try:
@@ -88,7 +105,6 @@ def process_exam_pdf(submission_id: int):
                     message=f"OCRResults saved to {ocr_result.get('relative_summary_path')}",
                     extra_data=ocr_result,
                 ))
-                db.commit()
             except Exception as ocr_error:
                 db.add(ProcessingLog(
                     submission_id=submission_id,
@@ -96,7 +112,6 @@ def process_exam_pdf(submission_id: int):
                     status="warning",
                     message=f"OCRResults generation failed: {ocr_error}",
                 ))
-                db.commit()
         logger.info(f"Extracting answers using AI from {len(image_paths)} pages")
         ai_extractor = get_ai_extractor()
         extraction_result = ai_extractor.extract_from_multiple_images(
@@ -107,28 +122,36 @@ def process_exam_pdf(submission_id: int):
         )
         validation_result = ai_extractor.validate_extraction(extraction_result)
         json_gen = get_json_generator()
-        json_data = json_gen.generate_with_validation(
+        json_output = json_gen.build_with_validation(
             str(getattr(sub,'filename')),
             extraction_result,
             validation_result
         )
         json_filename = f"{Path(str(getattr(sub,'filename'))).stem}.json"
-        save = storage.save_json(json_data, json_filename)
+        save = storage.save_json_obj(json_output, json_filename)
         setattr(sub,'result_json_key', save['relative_path'])
-        db.commit()
-        for mcq in extraction_result.get('multiple_choice', []):
-            db.add(MultipleChoiceAnswer(
-                submission_id=submission_id,
-                question_number=mcq['question'],
-                selected_answer=mcq['answer']
-            ))
+        mcq_rows = [
+            {
+                "submission_id": submission_id,
+                "question_number": mcq['question'],
+                "selected_answer": mcq['answer'],
+            }
+            for mcq in extraction_result.get('multiple_choice', [])
+        ]
+        fr_rows = []
         for fr in extraction_result.get('free_response', []):
-            db.add(FreeResponseAnswer(
-                submission_id=submission_id,
-                question_number=fr['question'],
-                response_text=fr['response'],
-                word_count=len(fr['response'].split())
-            ))
+            response_text = fr['response']
+            fr_rows.append({
+                "submission_id": submission_id,
+                "question_number": fr['question'],
+                "response_text": response_text,
+                "word_count": len(response_text.split()) if response_text else 0,
+            })
+        # Core executemany INSERTs: one statement per table, no ORM state
+        if mcq_rows:
+            db.execute(insert(MultipleChoiceAnswer), mcq_rows)
+        if fr_rows:
+            db.execute(insert(FreeResponseAnswer), fr_rows)
         setattr(sub,'status','completed')
         setattr(sub,'processed_at', datetime.utcnow())
         db.add(ProcessingLog(
@@ -140,11 +163,6 @@ def process_exam_pdf(submission_id: int):
         ))
         db.commit()
         logger.info(f"Successfully processed submission {submission_id}")
-        for image_path in image_paths:
-            try:
-                Path(image_path).unlink(missing_ok=True)
-            except Exception:
-                pass
         return {
             "status": "success",
             "submission_id": submission_id,
@@ -153,7 +171,8 @@ def process_exam_pdf(submission_id: int):
         }
     except Exception as e:
         logger.error(f"Failed to process submission {submission_id}: {e}")
-        sub = db.query(ExamSubmission).filter(ExamSubmission.id == submission_id).first()
+        db.rollback()
+        sub = db.get(ExamSubmission, submission_id)
         if sub:
             setattr(sub,'status','failed')
             setattr(sub,'error_message', str(e))
@@ -170,6 +189,8 @@ def process_exam_pdf(submission_id: int):
             "error": str(e)
         }
     finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
         db.close()
 
 
@@ -10,12 +10,14 @@ if sys.platform == 'win32':
     multiprocessing.freeze_support()
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 from contextlib import asynccontextmanager
 
 from backend.api import routes
 from backend.db.database import init_db
+from backend.db.async_database import async_engine
 from backend.config import get_settings
 
 # Configure logging
@@ -36,6 +38,8 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     logger.info("Shutting down application...")
+    routes.shutdown_pdf_pool()
+    await async_engine.dispose()
 
 
 # Create FastAPI app
@@ -43,7 +47,8 @@ app = FastAPI(
     title="Exam Answer Sheet Extraction API",
     description="API for extracting answers from PDF exam sheets using AI",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS